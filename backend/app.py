@@ -1,17 +1,49 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, g, send_file
 from flask_cors import CORS
-import requests
 import os
+import logging
+import gzip
+import threading
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import shapely
 from dotenv import load_dotenv
-from shapely.geometry import shape, Point as ShapelyPoint
-from db import init_db, save_filters, load_filters, delete_filters, get_user_filter_names
-from llm import extract_filter_with_llm, extract_filter_nlp_patterns
 
-# Load environment variables
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Load environment variables before the local modules read their settings
 load_dotenv()
 
+# Per-item detail is logged at DEBUG, so it costs one level check unless LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+from db import (init_db, init_llm_cache, get_llm_cache_size, save_filters, save_filters_bulk, load_filters,
+                update_filter_matches, delete_filters, delete_filters_bulk, get_user_filter_names)
+from llm import extract_filters, llm_cache_stats, extraction_stats, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
+from cache import LRUCache, SharedCache, SingleFlight, estimate_json_bytes
+from building_store import BuildingStore, FILTER_ATTRIBUTES, compile_filter, pack_matches, unpack_matches
+from socrata import fetch_rows, get_json, SOCRATA_MAX_CONCURRENCY
+from geometry import polygons_to_geometries, lod_band, simplify_to_polygons, flatten_polygons, shell_means
+from snapshot import save_snapshot, read_snapshot_metadata, load_snapshot
+from tiles import valid_tile, tile_bbox, encode_tile, MAX_ZOOM
+from viewport import DOWNTOWN_BBOX, parse_bbox, parse_point, grid_tiles, count_grid_tiles, polygon_intersects_bbox
+from metrics import (timed, start_request, finish_request, server_timing_header, stage_seconds, request_seconds,
+                     render_metric)
+from profiling import (authorized as profiling_authorized, start_profile, finish_profile, profile_path,
+                       profile_report, list_profiles, profiling_status)
+from land_use import (build_land_use_index, assign_land_use, covers_point, covers_points,
+                      find_land_use_at, find_land_use_many, land_use_summary)
+
 # Initialize database
 init_db()
+init_llm_cache()
 
 
 app = Flask(__name__)
@@ -26,16 +58,162 @@ BUILDING_URL = os.getenv('BUILDING_API_URL', 'https://data.calgary.ca/resource/c
 CALGARY_APP_TOKEN = os.getenv('CALGARY_APP_TOKEN')
 CALGARY_API_SECRET = os.getenv('CALGARY_API_SECRET')
 
-# Cache for building data
-buildings_cache = {
-    'raw_data': None,
-    'processed_data': None,
+# Cache duration in seconds (e.g., 1 hour)
+CACHE_DURATION = 3600
+
+# Viewports are split into fixed grid tiles (in degrees) that are fetched and cached independently
+BUILDING_TILE_SIZE = float(os.getenv('BUILDING_TILE_SIZE', 0.01))
+# Maximum number of buildings requested per tile (fetched in concurrent pages)
+BUILDING_TILE_LIMIT = int(os.getenv('BUILDING_TILE_LIMIT', 10000))
+# Largest viewport accepted, in tiles
+MAX_VIEWPORT_TILES = int(os.getenv('MAX_VIEWPORT_TILES', 64))
+
+# Memory for the in-process caches across the whole host. Each worker gets an equal
+# share, so adding workers splits the budget instead of multiplying it; what a worker
+# evicts is still on the host in the shared raw cache and the dataset snapshots
+CACHE_MEMORY_BUDGET = int(os.getenv('CACHE_MEMORY_BUDGET', 512 * 1024 * 1024))
+# Set by gunicorn.conf.py from its worker count
+CACHE_WORKERS = max(1, int(os.getenv('GUNICORN_WORKERS', 1)))
+WORKER_CACHE_BUDGET = CACHE_MEMORY_BUDGET // CACHE_WORKERS
+
+# Entry and byte budget of the processed building cache (5/8 of the worker's share)
+BUILDINGS_CACHE_MAX_ENTRIES = int(os.getenv('BUILDINGS_CACHE_MAX_ENTRIES', 32))
+BUILDINGS_CACHE_MAX_BYTES = int(os.getenv('BUILDINGS_CACHE_MAX_BYTES', WORKER_CACHE_BUDGET * 5 // 8))
+# Byte budget of the raw tile cache (1/4 of the worker's share)
+RAW_TILE_CACHE_MAX_BYTES = int(os.getenv('RAW_TILE_CACHE_MAX_BYTES', WORKER_CACHE_BUDGET // 4))
+# The raw cache holds grid tiles rather than viewports, so it has room for two of the
+# largest viewports; anything less and a big viewport evicts its own tiles while stitching
+RAW_TILE_CACHE_MAX_ENTRIES = int(os.getenv('RAW_TILE_CACHE_MAX_ENTRIES',
+                                           max(BUILDINGS_CACHE_MAX_ENTRIES, 2 * MAX_VIEWPORT_TILES)))
+
+# Caches for building data keyed by limit and bbox. Raw upstream responses and
+# processed buildings are tracked separately so each has its own TTL and stats
+raw_buildings_cache = LRUCache('raw_buildings', max_entries=RAW_TILE_CACHE_MAX_ENTRIES,
+                               max_bytes=RAW_TILE_CACHE_MAX_BYTES, ttl=CACHE_DURATION)
+def payload_bytes(payload):
+    """Bytes held by a payload's encoded variants"""
+    return sum(len(payload[encoding]) for encoding in ('identity', 'gzip', 'br') if encoding in payload)
+
+
+def dataset_bytes(dataset):
+    """Approximate memory of a dataset entry, including the payloads and LOD polygons kept on it"""
+    size = estimate_json_bytes(dataset['buildings']) + dataset['store'].nbytes
+    size += sum(payload_bytes(payload) for payload in dataset.get('payloads', {}).values())
+    size += sum(estimate_json_bytes(polygons) for polygons in dataset.get('lod_polygons', {}).values())
+    return size
+
+
+processed_buildings_cache = LRUCache('processed_buildings', max_entries=BUILDINGS_CACHE_MAX_ENTRIES,
+                                     max_bytes=BUILDINGS_CACHE_MAX_BYTES, ttl=CACHE_DURATION,
+                                     sizeof=dataset_bytes)
+
+# Cache for the parsed land use layer (shapely geometries, STRtree and records)
+land_use_cache = {
+    'index': None,
     'cache_time': None,
-    'bbox': None
+    'version': 0
 }
 
-# Cache duration in seconds (e.g., 1 hour)
-CACHE_DURATION = 3600
+# Land use zoning changes rarely, so it can be kept much longer than buildings
+LAND_USE_CACHE_DURATION = int(os.getenv('LAND_USE_CACHE_DURATION', 24 * 3600))
+
+# Overall time budget for extracting the filters of one /api/filter-buildings request
+FILTER_EXTRACTION_DEADLINE = float(os.getenv('FILTER_EXTRACTION_DEADLINE', 20))
+
+# Maximum number of land use polygons loaded into the local layer. The default is well
+# above the size of the city's whole layer, which is fetched in concurrent pages, so
+# point lookups can trust a miss instead of asking the API
+LAND_USE_LIMIT = int(os.getenv('LAND_USE_LIMIT', 200000))
+
+# Maximum number of points accepted by the batch land use lookup
+LAND_USE_BATCH_LIMIT = 10000
+# Maximum number of distinct points in one batch that fall back to the API (run concurrently);
+# points past it are reported as unresolved
+LAND_USE_BATCH_FALLBACK_LIMIT = int(os.getenv('LAND_USE_BATCH_FALLBACK_LIMIT', 32))
+
+# Buildings are left out of vector tiles below this zoom, where one tile spans too much of the city
+TILE_MIN_BUILDING_ZOOM = int(os.getenv('TILE_MIN_BUILDING_ZOOM', 13))
+
+# Hot cache entries are rebuilt in the background this many seconds before they expire
+CACHE_REFRESH_AHEAD = int(os.getenv('CACHE_REFRESH_AHEAD', 300))
+# Seconds between background refresher passes (0 disables the refresher)
+CACHE_REFRESH_INTERVAL = int(os.getenv('CACHE_REFRESH_INTERVAL', 60))
+
+# SQLite file holding raw upstream responses for every worker on the host, so each
+# tile is fetched once rather than once per worker (set to '' to disable)
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'shared_cache.db'))
+shared_buildings_cache = SharedCache(SHARED_CACHE_PATH, 'raw_buildings', ttl=CACHE_DURATION) if SHARED_CACHE_PATH else None
+shared_land_use_cache = SharedCache(SHARED_CACHE_PATH, 'land_use', ttl=LAND_USE_CACHE_DURATION) if SHARED_CACHE_PATH else None
+
+# Directory for on-disk snapshots of processed, land use joined datasets, so a restarted
+# worker can serve them straight away (set to '' to disable)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), 'snapshots'))
+# Snapshots older than this are ignored rather than served stale
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', 7 * 24 * 3600))
+# Only this many of the most recently written snapshots are kept (older ones are deleted
+# on save), one per dataset the processed cache can hold by default
+SNAPSHOT_MAX_FILES = int(os.getenv('SNAPSHOT_MAX_FILES', BUILDINGS_CACHE_MAX_ENTRIES))
+
+# Concurrent misses for the same cache key wait on one fill instead of each doing it
+cache_flights = SingleFlight('cache_fills')
+
+# Guards swapping the land use layer in and out of land_use_cache
+land_use_lock = threading.Lock()
+
+# Encoded vector tiles keyed by z/x/y and land use version (1/8 of the worker's share)
+vector_tile_cache = LRUCache('vector_tiles', max_entries=int(os.getenv('VECTOR_TILE_CACHE_MAX_ENTRIES', 4096)),
+                             max_bytes=int(os.getenv('VECTOR_TILE_CACHE_MAX_BYTES', WORKER_CACHE_BUDGET // 8)),
+                             ttl=CACHE_DURATION,
+                             sizeof=payload_bytes)
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    start_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    """Report the request's stage timings in a Server-Timing header and the request latency histogram"""
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    response.headers['Server-Timing'] = server_timing_header(finish_request(), elapsed)
+    # The route pattern rather than the path, so tiles and bboxes don't each get a series
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_seconds.observe((endpoint, request.method, str(response.status_code)), elapsed)
+    return response
+
+
+@app.before_request
+def start_request_profile():
+    """Profile this request if profiling is enabled and it asks with an X-Profile header"""
+    if 'X-Profile' not in request.headers or not profiling_authorized(request.headers['X-Profile']):
+        return
+    # The profile endpoints take the same header as their credentials
+    if request.endpoint in ('profiles', 'download_profile'):
+        return
+    g.profiler = start_profile()
+    g.profile_skipped = g.profiler is None
+
+
+@app.after_request
+def finish_request_profile(response):
+    """Store the request's profile and point the client at it (runs before add_server_timing)"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profile_id = finish_profile(profiler, f"{request.method} {request.full_path}")
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Url'] = f"/api/profiles/{profile_id}"
+    elif g.get('profile_skipped'):
+        response.headers['X-Profile-Skipped'] = 'rate limited'
+    return response
+
+
+@app.teardown_request
+def abandon_request_profile(error=None):
+    # A request that never produced a response still has to give the profiling slot back
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        finish_profile(profiler, f"{request.method} {request.full_path} (failed)")
 
 @app.route('/')
 def health_check():
@@ -48,10 +226,14 @@ def health_check():
             "/api/buildings-with-land-use",
             "/api/filter-buildings",
             "/api/land-use",
+            "/api/land-use/batch",
+            "/api/tiles/{z}/{x}/{y}.mvt",
             "/api/filters/save",
             "/api/filters/load",
             "/api/filters/delete",
-            "/api/filters/list"
+            "/api/filters/list",
+            "/api/filters/save-bulk",
+            "/api/filters/delete-bulk"
         ]
     })
 
@@ -66,11 +248,17 @@ def api_info():
             "buildings_with_land_use": "/api/buildings-with-land-use",
             "filter_buildings": "/api/filter-buildings",
             "land_use": "/api/land-use",
+            "land_use_batch": "/api/land-use/batch",
+            "tiles": "/api/tiles/{z}/{x}/{y}.mvt",
+            "metrics": "/api/metrics",
+            "profiles": "/api/profiles",
             "filters": {
                 "save": "/api/filters/save",
                 "load": "/api/filters/load",
                 "delete": "/api/filters/delete",
-                "list": "/api/filters/list"
+                "list": "/api/filters/list",
+                "save_bulk": "/api/filters/save-bulk",
+                "delete_bulk": "/api/filters/delete-bulk"
             }
         }
     })
@@ -99,16 +287,55 @@ def center_point(polygon):
     # Return as a tuple (longitude, latitude)
     return (center_x, center_y)
 
+def building_centers(polygons, flattened):
+    """
+    (longitudes, latitudes) lists of every polygon's center_point, (0, 0) where it has
+    none. flattened is flatten_polygons(polygons), or None if they couldn't be flattened
+    """
+    if flattened is None:
+        # Coordinates that aren't (x, y) pairs go through center_point one by one
+        centers = [center_point(polygon) or (0, 0) for polygon in polygons]
+        return [center[0] for center in centers], [center[1] for center in centers]
+
+    longitudes, latitudes, has_center = shell_means(polygons, flattened)
+
+    longitudes = longitudes.tolist()
+    latitudes = latitudes.tolist()
+    # center_point's fallback is the integer pair (0, 0), which serializes differently from 0.0
+    for i in np.flatnonzero(~has_center).tolist():
+        longitudes[i] = latitudes[i] = 0
+    return longitudes, latitudes
+
+
+def building_heights(buildings):
+    """Heights as the strings process_buildings stores: rooftop minus ground, "0" if either is missing"""
+    rooftop_z = np.fromiter(map(float, [building.get("rooftop_elev_z") or 0 for building in buildings]),
+                            dtype=np.float64, count=len(buildings))
+    ground_z = np.fromiter(map(float, [building.get("grd_elev_min_z") or 0 for building in buildings]),
+                           dtype=np.float64, count=len(buildings))
+    heights = (rooftop_z - ground_z).tolist()
+    for i in np.flatnonzero((rooftop_z == 0) | (ground_z == 0)).tolist():
+        heights[i] = 0
+    return [str(height) for height in heights]
+
+
 def process_buildings(buildings):
+    """
+    Building records for raw upstream rows, along with a shapely array of their
+    polygons (None where missing or invalid)
+    """
     processed = []
-    building_count = 0
-    for building in buildings:
-        # Calculate building height
-        rooftop_z = float(building.get("rooftop_elev_z") or 0)
-        ground_z = float(building.get("grd_elev_min_z") or 0)
-        height = rooftop_z - ground_z if rooftop_z and ground_z else 0
-        longitude, latitude = center_point(building.get("polygon", {})) or (0, 0)
-        
+    # Heights, centers and geometries are computed over the whole batch, and the
+    # polygons' coordinates are only pulled out of the GeoJSON once for both of the latter
+    polygons = [building.get("polygon", {}) for building in buildings]
+    try:
+        flattened = flatten_polygons(polygons)
+    except ValueError:
+        flattened = None
+    heights = building_heights(buildings)
+    longitudes, latitudes = building_centers(polygons, flattened)
+    geometries = polygons_to_geometries(polygons, flattened)
+    for building_count, building in enumerate(buildings):
         processed.append({
             "grd_elev_min_x": building.get("grd_elev_min_x"),
             "grd_elev_max_x": building.get("grd_elev_max_x"),
@@ -119,94 +346,464 @@ def process_buildings(buildings):
             "rooftop_elev_x": building.get("rooftop_elev_x"),
             "rooftop_elev_y": building.get("rooftop_elev_y"),
             "rooftop_elev_z": building.get("rooftop_elev_z"),
-            "height": str(height),  # Add calculated height field
+            "height": heights[building_count],  # Add calculated height field
             "land_use": building.get("land_use"),
             "polygon": building.get("polygon"),  # coordinates in GeoJSON format
             "struct_id": building.get("struct_id"),
             "id": building_count,
             "colour": 0xcccccc, # default color for buildings
-            "longitude": longitude,
-            "latitude": latitude,
+            "longitude": longitudes[building_count],
+            "latitude": latitudes[building_count],
         })
-        building_count += 1
-    return processed
+    return processed, geometries
 
 
-def get_cached_processed_buildings(limit=1000, bbox=None):
-    import time
-    
-    # Create a cache key based on bbox and limit
-    cache_key = f"{limit}_{bbox}"
-    current_time = time.time()
-    
+def buildings_cache_key(limit, bbox):
+    """Cache key for building data requested with the given limit and bbox"""
+    if not bbox:
+        return f"{limit}_all"
+    return f"{limit}_{bbox['min_lng']}_{bbox['min_lat']}_{bbox['max_lng']}_{bbox['max_lat']}"
+
+
+def request_bbox(value):
+    """Viewport bbox for a request, defaulting to downtown. Raises ValueError if invalid or too large"""
+    bbox = parse_bbox(value) or DOWNTOWN_BBOX
+    tile_count = count_grid_tiles(bbox, BUILDING_TILE_SIZE)
+    if tile_count > MAX_VIEWPORT_TILES:
+        raise ValueError(f"bbox is too large ({tile_count} tiles, maximum is {MAX_VIEWPORT_TILES})")
+    return bbox
+
+
+def request_lod(value):
+    """Level-of-detail band for an optional zoom parameter, None for full detail. Raises ValueError if invalid"""
+    if value in (None, ''):
+        return None
+    try:
+        zoom = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid zoom: {value!r}")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    band = lod_band(zoom)
+    return band if band[1] is not None else None
+
+
+def fetch_viewport_buildings(limit=1000, bbox=None, refresh=False):
+    """
+    Fetch the raw buildings for a viewport by stitching together the grid tiles that
+    cover it. Each tile is cached on its own, so overlapping or adjacent viewports
+    reuse tiles that were already fetched. refresh skips the cache and refetches every tile
+    """
+    if not bbox:
+        return fetch_building_data(limit=limit, refresh=refresh)
+
+    tiles = grid_tiles(bbox, BUILDING_TILE_SIZE)
+
+    # Fetch the tiles concurrently; cached tiles return straight away and the
+    # upstream concurrency cap in socrata.py still applies to the rest. Each tile is
+    # clipped to the viewport as soon as it arrives, while the others are still in flight
+    tile_results = [None] * len(tiles)
+    with ThreadPoolExecutor(max_workers=min(SOCRATA_MAX_CONCURRENCY, len(tiles))) as executor:
+        futures = {executor.submit(fetch_building_data, limit=limit, bbox=tile, refresh=refresh): position
+                   for position, tile in enumerate(tiles)}
+        for future in as_completed(futures):
+            position = futures[future]
+            tile_data = future.result()
+            if len(tile_data) >= limit:
+                logger.warning("Tile %s hit the %d building limit", buildings_cache_key(limit, tiles[position]), limit)
+            tile_results[position] = [building for building in tile_data
+                                      if polygon_intersects_bbox(building.get("polygon"), bbox)]
+
+    # Stitch in tile order so the result doesn't depend on which tile arrived first
+    stitched = []
+    seen_ids = set()
+    for tile_data in tile_results:
+        for building in tile_data:
+            # Buildings crossing a tile edge are returned by both tiles
+            struct_id = building.get("struct_id")
+            if struct_id is not None:
+                if struct_id in seen_ids:
+                    continue
+                seen_ids.add(struct_id)
+            stitched.append(building)
+
+    logger.info("Stitched %d buildings from %d tiles", len(stitched), len(tiles))
+    return stitched
+
+
+def build_dataset(limit=1000, bbox=None, refresh=False):
+    """
+    Fetch and process the buildings for a viewport, as
+    {'buildings': [...], 'store': BuildingStore, 'limit', 'bbox'}
+    """
+    with timed('upstream_fetch'):
+        raw_data = fetch_viewport_buildings(limit=limit, bbox=bbox, refresh=refresh)
+    with timed('process_buildings'):
+        processed_data, geometries = process_buildings(raw_data)
+        store = BuildingStore(processed_data)
+    return {
+        'buildings': processed_data,
+        'store': store,
+        'geometries': geometries,
+        # Kept so the background refresher can rebuild the entry
+        'limit': limit,
+        'bbox': bbox,
+        'fetched_at': time.time()
+    }
+
+
+def get_cached_dataset(limit=1000, bbox=None):
+    """
+    Processed buildings for a viewport along with their columnar store, as
+    {'buildings': [...], 'store': BuildingStore}
+    """
+    cache_key = buildings_cache_key(limit, bbox)
+
     # Check if we have valid cached processed data
-    if (buildings_cache['processed_data'] is not None and 
-        buildings_cache['cache_time'] is not None and
-        buildings_cache['bbox'] == cache_key and
-        current_time - buildings_cache['cache_time'] < CACHE_DURATION):
-        
-        print(f"Using cached processed building data ({len(buildings_cache['processed_data'])} buildings)")
-        return buildings_cache['processed_data']
-    
-    # Fetch and process fresh data
-    raw_data = fetch_building_data(limit=limit, bbox=bbox)
-    processed_data = process_buildings(raw_data)
-    
-    # Update processed data cache
-    buildings_cache['processed_data'] = processed_data
-    print(f"Processed and cached {len(processed_data)} buildings")
+    dataset = processed_buildings_cache.get(cache_key)
+    if dataset is not None:
+        logger.debug("Using cached processed building data (%d buildings)", len(dataset['buildings']))
+        return dataset
     
-    return processed_data
+    def load():
+        # An earlier flight may have filled the entry just before this one started
+        dataset = processed_buildings_cache.peek(cache_key)
+        if dataset is not None:
+            return dataset
 
+        # A snapshot from an earlier run saves the upstream fetch and the land use join
+        dataset = load_dataset_snapshot(cache_key)
+        if dataset is not None:
+            return dataset
+
+        # Fetch and process fresh data
+        dataset = build_dataset(limit=limit, bbox=bbox)
+        processed_data = dataset['buildings']
+
+        # Update processed data cache
+        processed_buildings_cache.set(cache_key, dataset)
+        logger.info("Processed and cached %d buildings", len(processed_data))
+
+        return dataset
+
+    return cache_flights.do(('dataset', cache_key), load)
+
+
+def snapshot_path(cache_key):
+    return os.path.join(SNAPSHOT_DIR, hashlib.blake2b(cache_key.encode('utf-8'), digest_size=8).hexdigest() + '.npz')
+
+
+def save_dataset_snapshot(cache_key, dataset):
+    """Persist a land use joined dataset so restarted workers can load it instead of refetching"""
+    if not SNAPSHOT_DIR:
+        return
+    try:
+        start = time.time()
+        save_snapshot(snapshot_path(cache_key), dataset['buildings'], dataset.get('geometries'), {
+            'cache_key': cache_key,
+            'source': BUILDING_URL,
+            'limit': dataset['limit'],
+            'bbox': dataset['bbox'],
+            # Content version: the ETag of the joined payload and the land use layer it was joined with
+            'data_version': dataset['payloads']['buildings_with_land_use']['etag'],
+            'land_use_fingerprint': dataset['land_use_fingerprint'],
+            'fetched_at': dataset['fetched_at']
+        })
+        logger.info("Saved snapshot of %s in %.2fs", cache_key, time.time() - start)
+    except Exception as e:
+        logger.warning("Could not save snapshot of %s: %s", cache_key, e)
+    prune_snapshots()
+
+
+def remove_snapshot(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # Another worker removed it first
+
+
+def prune_snapshots():
+    """Delete snapshots past SNAPSHOT_MAX_AGE and all but the SNAPSHOT_MAX_FILES newest"""
+    snapshots = []
+    for name in os.listdir(SNAPSHOT_DIR) if os.path.isdir(SNAPSHOT_DIR) else []:
+        if name.endswith('.npz'):
+            path = os.path.join(SNAPSHOT_DIR, name)
+            try:
+                snapshots.append((os.path.getmtime(path), path))
+            except OSError:
+                continue  # Another worker pruned it first
+    snapshots.sort(reverse=True)
 
-def fetch_building_data(limit=1000, bbox=None):
-    import time
-    
-    # Create a cache key based on bbox and limit
-    cache_key = f"{limit}_{bbox}"
     current_time = time.time()
-    
+    for position, (modified, path) in enumerate(snapshots):
+        if position >= SNAPSHOT_MAX_FILES or current_time - modified > SNAPSHOT_MAX_AGE:
+            remove_snapshot(path)
+
+
+def load_dataset_snapshot(cache_key):
+    """Load a dataset from its snapshot into the processed cache, or None if there is no usable one"""
+    if not SNAPSHOT_DIR:
+        return None
+    path = snapshot_path(cache_key)
+    if not os.path.exists(path):
+        return None
+
+    metadata = read_snapshot_metadata(path)
+    if metadata is None:
+        # Unreadable or from another schema version, it would only fail again next time
+        remove_snapshot(path)
+        return None
+    if (metadata.get('cache_key') != cache_key or metadata.get('source') != BUILDING_URL or
+            time.time() - metadata['fetched_at'] > SNAPSHOT_MAX_AGE):
+        return None
+
+    start = time.time()
+    try:
+        with timed('snapshot_load'):
+            buildings, geometries, metadata = load_snapshot(path)
+    except Exception as e:
+        # A corrupted snapshot falls back to building the dataset, which writes a fresh one
+        logger.warning("Discarding unreadable snapshot %s: %s", path, e)
+        remove_snapshot(path)
+        return None
+    dataset = {
+        'buildings': buildings,
+        'store': BuildingStore(buildings),
+        'geometries': geometries,
+        'limit': metadata['limit'],
+        'bbox': metadata['bbox'],
+        'fetched_at': metadata['fetched_at'],
+        'land_use_fingerprint': metadata['land_use_fingerprint']
+    }
+
+    # The join only counts if it was made against the land use layer loaded now
+    try:
+        land_use_index = get_cached_land_use_index()
+        if land_use_index['fingerprint'] == metadata['land_use_fingerprint']:
+            dataset['land_use_version'] = land_use_index['version']
+    except Exception as e:
+        logger.warning("Land use layer unavailable, snapshot join will be redone: %s", e)
+
+    # Past its cache period the snapshot is served stale until the refresher's next pass replaces it
+    age = time.time() - metadata['fetched_at']
+    ttl = max(CACHE_DURATION - age, CACHE_REFRESH_AHEAD + CACHE_REFRESH_INTERVAL)
+    processed_buildings_cache.set(cache_key, dataset, ttl=ttl)
+    logger.info("Loaded snapshot of %s (%d buildings, %.0fs old) in %.2fs", cache_key, len(buildings), age, time.time() - start)
+    return dataset
+
+
+def fetch_building_data(limit=1000, bbox=None, refresh=False):
+    cache_key = buildings_cache_key(limit, bbox)
+
     # Check if we have valid cached data
-    if (buildings_cache['raw_data'] is not None and 
-        buildings_cache['cache_time'] is not None and
-        buildings_cache['bbox'] == cache_key and
-        current_time - buildings_cache['cache_time'] < CACHE_DURATION):
-        
-        print(f"Using cached building data ({len(buildings_cache['raw_data'])} buildings)")
-        return buildings_cache['raw_data']
-    
-    # Fetch fresh data
-    print(f"Fetching fresh building data from API...")
-    url = BUILDING_URL
-    params = {"$limit": limit}
-    if bbox:
-        params["$where"] = f"within_box(polygon, {bbox['max_lat']}, {bbox['min_lng']}, {bbox['min_lat']}, {bbox['max_lng']})"
-    
-    params = get_api_params(params)
-    res = requests.get(url, params=params)
-    res.raise_for_status()
-    raw_data = res.json()
-    
-    # Update cache
-    buildings_cache['raw_data'] = raw_data
-    buildings_cache['cache_time'] = current_time
-    buildings_cache['bbox'] = cache_key
-    print(f"Cached {len(raw_data)} buildings")
+    raw_data = None if refresh else raw_buildings_cache.get(cache_key)
+    if raw_data is not None:
+        logger.debug("Using cached building data (%d buildings)", len(raw_data))
+        return raw_data
     
-    return raw_data
+    def fetch():
+        # Fetch fresh data, paging through anything over one page concurrently
+        logger.info("Fetching fresh building data for %s", cache_key)
+        url = BUILDING_URL
+        params = {}
+        if bbox:
+            params["$where"] = f"within_box(polygon, {bbox['max_lat']}, {bbox['min_lng']}, {bbox['min_lat']}, {bbox['max_lng']})"
+
+        params = get_api_params(params)
+        return fetch_rows(url, params, max_rows=limit)
+
+    def load():
+        raw_data = None if refresh else raw_buildings_cache.peek(cache_key)
+        if raw_data is not None:
+            return raw_data
+
+        if shared_buildings_cache is not None:
+            # Another worker may already have this tile, or be fetching it right now.
+            # A refresh accepts a copy some other worker refreshed within the refresh window
+            raw_data = shared_buildings_cache.get_or_fetch(cache_key, fetch,
+                                                           max_age=CACHE_REFRESH_AHEAD if refresh else None)
+        else:
+            raw_data = fetch()
+
+        # Update cache
+        raw_buildings_cache.set(cache_key, raw_data)
+        logger.debug("Cached %d buildings", len(raw_data))
+
+        return raw_data
+
+    return cache_flights.do(('raw_buildings', cache_key, refresh), load)
+
+
+def get_cached_land_use_index(refresh=False):
+    current_time = time.time()
+
+    # Check if we have a valid cached land use layer
+    with land_use_lock:
+        index = land_use_cache['index']
+        cache_time = land_use_cache['cache_time']
+    if (not refresh and
+        index is not None and
+        cache_time is not None and
+        current_time - cache_time < LAND_USE_CACHE_DURATION):
+
+        logger.debug("Using cached land use layer v%d (%d polygons)", index['version'], len(index['records']))
+        return index
+
+    def fetch():
+        logger.info("Fetching land use data from %s", CALGARY_LAND_USE_API)
+        return fetch_rows(CALGARY_LAND_USE_API, get_api_params(), max_rows=LAND_USE_LIMIT)
+
+    def load():
+        with land_use_lock:
+            index = land_use_cache['index']
+            if (not refresh and index is not None and land_use_cache['cache_time'] is not None and
+                    time.time() - land_use_cache['cache_time'] < LAND_USE_CACHE_DURATION):
+                return index
+
+        with timed('land_use_fetch'):
+            if shared_land_use_cache is not None:
+                land_use_data = shared_land_use_cache.get_or_fetch(str(LAND_USE_LIMIT), fetch,
+                                                                   max_age=CACHE_REFRESH_AHEAD if refresh else None)
+            else:
+                land_use_data = fetch()
+
+        # Parse the land use polygons once and index them with an STRtree so each
+        # building only gets tested against the parcels whose bounds it overlaps
+        with timed('land_use_index'):
+            index = build_land_use_index(land_use_data)
+        # If the limit was hit there may be parcels inside the extent that were not loaded
+        index['complete'] = len(land_use_data) < LAND_USE_LIMIT
+        if not index['complete']:
+            logger.warning("Land use layer hit the %d polygon limit; lookups missing it will query the API", LAND_USE_LIMIT)
+
+        # Swap the new layer in as a whole; the version travels with the index so a
+        # caller never pairs one layer with another layer's version
+        with land_use_lock:
+            land_use_cache['version'] += 1
+            index['version'] = land_use_cache['version']
+            land_use_cache['index'] = index
+            land_use_cache['cache_time'] = time.time()
+        logger.info("Cached land use layer v%d (%d polygons, ~%d bytes)", index['version'], len(index['records']), index['memory_bytes'])
+
+        return index
+
+    return cache_flights.do(('land_use', refresh), load)
+
+
+def build_payload(body):
+    """Identity/gzip/brotli variants of a response body with a strong ETag"""
+    payload = {
+        'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=6)
+    }
+    if brotli is not None:
+        payload['br'] = brotli.compress(body, quality=5)
+    return payload
+
+
+def dataset_geometries(dataset):
+    """Shapely geometries of a dataset's building polygons, parsed once and kept on the entry"""
+    geometries = dataset.get('geometries')
+    if geometries is None:
+        geometries = polygons_to_geometries([building.get("polygon") for building in dataset['buildings']])
+        dataset['geometries'] = geometries
+    return geometries
+
+
+def lod_buildings(dataset, band):
+    """
+    Copies of a dataset's buildings with polygons simplified and rounded for a
+    level-of-detail band. The simplified polygons are kept on the cache entry per band
+    """
+    lod_polygons = dataset.setdefault('lod_polygons', {})
+    polygons = lod_polygons.get(band)
+    if polygons is None:
+        _, tolerance, decimals = band
+        polygons = simplify_to_polygons(dataset_geometries(dataset), tolerance, decimals)
+        lod_polygons[band] = polygons
+        resize_dataset_entry(dataset)
+    return [{**building, "polygon": polygon} for building, polygon in zip(dataset['buildings'], polygons)]
+
+
+def get_json_payload(dataset, kind, version, lod=None):
+    """
+    Serialized JSON of a dataset's buildings (at full detail, or for a level-of-detail
+    band) with gzip/brotli variants and a strong ETag, kept on the cache entry and
+    only rebuilt when version changes
+    """
+    if lod is not None:
+        kind = f"{kind}@z{lod[0]}"
+    payloads = dataset.setdefault('payloads', {})
+    payload = payloads.get(kind)
+    if payload is not None and payload['version'] == version:
+        return payload
+
+    def serialize():
+        buildings = dataset['buildings']
+        if lod is not None:
+            with timed('simplify'):
+                buildings = lod_buildings(dataset, lod)
+        with timed('json_serialization'):
+            body = app.json.dumps(buildings).encode('utf-8')
+        with timed('compression'):
+            payload = build_payload(body)
+        payload['version'] = version
+
+        payloads[kind] = payload
+        resize_dataset_entry(dataset)
+        logger.info("Serialized %s payload: %d bytes, gzip %d bytes", kind, len(body), len(payload['gzip']))
+        return payload
+
+    # Requests arriving together for a cold payload share one serialization
+    return cache_flights.do(('payload', id(dataset), kind, version), serialize)
+
+
+def resize_dataset_entry(dataset):
+    """Count what was just attached to a cached dataset against the cache's byte budget"""
+    processed_buildings_cache.resize(buildings_cache_key(dataset['limit'], dataset['bbox']), dataset)
+
+
+def send_payload(payload, mimetype='application/json'):
+    """Send a pre-serialized payload, answering 304 when the client already has it"""
+    # Each encoding is a different representation, so it gets its own strong ETag
+    etags = {encoding: f"{payload['etag']}-{encoding}" if encoding != 'identity' else payload['etag']
+             for encoding in ('identity', 'gzip', 'br') if encoding in payload}
+
+    encoding = 'identity'
+    if 'br' in payload and request.accept_encodings['br']:
+        encoding = 'br'
+    elif request.accept_encodings['gzip']:
+        encoding = 'gzip'
+
+    if any(request.if_none_match.contains(etag) for etag in etags.values()) or request.if_none_match.star_tag:
+        response = Response(status=304)
+        response.set_etag(etags[encoding])
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    response = Response(payload[encoding], mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Let browsers keep the body but check back with If-None-Match every time
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etags[encoding])
+    return response
 
 
 @app.route('/api/buildings')
 def buildings_endpoint():
-    downtown_bbox = {
-        "max_lat": 51.06,
-        "min_lat": 51.04,
-        "min_lng": -114.09,
-        "max_lng": -114.05
-    }
+    try:
+        bbox = request_bbox(request.args.get('bbox'))
+        lod = request_lod(request.args.get('zoom'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    processed = get_cached_processed_buildings(limit=1000, bbox=downtown_bbox)
-    return jsonify(processed)
+    dataset = get_cached_dataset(limit=BUILDING_TILE_LIMIT, bbox=bbox)
+    # The records carry land use once the combined endpoint has joined it
+    payload = get_json_payload(dataset, 'buildings', dataset.get('land_use_version', 0), lod)
+    return send_payload(payload)
 
 @app.route("/api/filter-buildings", methods=["POST"])
 def filter_buildings():
@@ -221,77 +818,182 @@ def filter_buildings():
         queries_to_process = [user_query]
     else:
         return jsonify({"error": "No query or queries provided"}), 400
+    if not all(isinstance(query, str) for query in queries_to_process):
+        return jsonify({"error": "Queries must be strings"}), 400
+
+    try:
+        bbox = request_bbox(data.get("bbox"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Get cached buildings
-    downtown_bbox = {
-        "max_lat": 51.06,
-        "min_lat": 51.04,
-        "min_lng": -114.09,
-        "max_lng": -114.05
-    }
-    
-    buildings = get_cached_processed_buildings(limit=1000, bbox=downtown_bbox)
+    store = get_cached_dataset(limit=BUILDING_TILE_LIMIT, bbox=bbox)['store']
     
     # Store results per filter for color mapping
     filter_results = []
-    all_matched_ids = set()  # Use set to avoid duplicates
+    unresolved = []
+    any_match = np.zeros(len(store), dtype=bool)
+
+    # Extract all the filters at once, anything slower than the deadline is reported as unresolved
+    extracted, failed = extract_filters(queries_to_process, FILTER_EXTRACTION_DEADLINE)
     
     # loop through all queries for multiple queries
     for query_index, query in enumerate(queries_to_process):
-        print(f"Processing query: '{query}'")
-        
-        filter_criteria = extract_filter_with_llm(query)
+        filter_criteria = extracted.get(query)
         if not filter_criteria:
-            print(f"Could not extract filter from query: '{query}'")
+            logger.info("Could not extract filter from query %r (%s)", query, failed.get(query))
+            unresolved.append({
+                "query": query,
+                "filter_index": query_index,
+                "reason": failed.get(query)
+            })
             continue
 
-        attr = filter_criteria["attribute"]
-        op = filter_criteria["operator"]
-        value = str(filter_criteria["value"])
-
-        def matches(b):
+        # Compile the criteria into index lookups instead of eval'ing LLM output
+        with timed('filter_evaluation'):
             try:
-                raw_val = b.get(attr)
-                if raw_val is None:
-                    return False
-
-                if isinstance(raw_val, str):
-                    raw_val = raw_val.lower().replace("m", "").strip()
-                    if not raw_val.replace(".", "", 1).isdigit():
-                        return False
-
-                v = float(raw_val)
-                result = eval(f"v {op} {value}")
-                if result:
-                    building_id = b.get("id", "unknown")
-                    print(f"Query '{query}': Building {building_id} matches ({attr}={v} {op} {value})")
-                return result
-            except Exception as e:
-                print(f"Error matching building for query '{query}': {e}")
-                return False
+                select_rows = compile_filter(filter_criteria)
+                rows = select_rows(store)
+            except ValueError as e:
+                logger.warning("Invalid filter for query %r: %s", query, e)
+                rows = np.zeros(0, dtype=np.int64)
 
-        # Find matches for this query
-        query_matches = [b.get("id") for b in buildings if matches(b)]
+            # Find matches for this query
+            query_matches = store.matching_ids(rows)
         filter_results.append({
             "query": query,
             "filter_index": query_index,
             "matches": query_matches
         })
-        all_matched_ids.update(query_matches)
-        print(f"Query '{query}' found {len(query_matches)} matches")
+        any_match[rows] = True
+        logger.debug("Query %r found %d matches", query, len(query_matches))
     
-    final_matches = list(all_matched_ids)
-    print(f"Total unique matches across all queries: {len(final_matches)}")
-    print(f"Matched building IDs: {final_matches}")
+    with timed('filter_evaluation'):
+        final_matches = store.matching_ids(any_match)
+    logger.debug("Total unique matches across all queries: %d", len(final_matches))
     
     # Return both individual filter results and combined results
     response = {
         "all_matches": final_matches,
-        "filter_results": filter_results
+        "filter_results": filter_results,
+        "unresolved": unresolved
     }
     
     return jsonify(response)
 
+
+def dataset_version(dataset):
+    """
+    Fingerprint of the buildings and filterable values in a dataset, so results cached
+    against it can be checked for staleness. Computed once and kept on the entry
+    """
+    version = dataset.get('version')
+    if version is None:
+        store = dataset['store']
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(buildings_cache_key(dataset['limit'], dataset['bbox']).encode('utf-8'))
+        digest.update(store.ids.tobytes())
+        for attribute in FILTER_ATTRIBUTES:
+            digest.update(store.column(attribute).tobytes())
+        version = digest.hexdigest()
+        dataset['version'] = version
+    return version
+
+
+def filter_queries(filters_data):
+    """The text queries of saved filters ([{id, query}, ...]), None if they aren't in that shape"""
+    if not isinstance(filters_data, list):
+        return None
+    queries = [item.get('query') if isinstance(item, dict) else None for item in filters_data]
+    if not queries or not all(isinstance(query, str) and query.strip() for query in queries):
+        return None
+    return queries
+
+
+def criteria_masks(store, criteria):
+    """(filters, buildings) boolean matrix of what each criteria matches, an empty row where it's None or invalid"""
+    masks = np.zeros((len(criteria), len(store)), dtype=bool)
+    with timed('filter_evaluation'):
+        for i, filter_criteria in enumerate(criteria):
+            if not filter_criteria:
+                continue
+            try:
+                masks[i, compile_filter(filter_criteria)(store)] = True
+            except ValueError as e:
+                logger.warning("Invalid saved filter criteria %r: %s", filter_criteria, e)
+    return masks
+
+
+def compute_saved_matches(dataset, queries, criteria):
+    """Resolved criteria and match bitmap of a filter set on a dataset, in the shape db.save_filters takes"""
+    masks = criteria_masks(dataset['store'], criteria)
+    return {
+        'criteria': [{'query': query, 'criteria': filter_criteria} for query, filter_criteria in zip(queries, criteria)],
+        'match_bitmap': pack_matches(masks),
+        'building_count': len(dataset['store']),
+        'dataset_bbox': dataset['bbox'],
+        'dataset_version': dataset_version(dataset)
+    }, masks
+
+
+def saved_filter_results(store, saved_criteria, masks):
+    """Results of a saved filter set in the /api/filter-buildings response format"""
+    filter_results = []
+    unresolved = []
+    for filter_index, (saved, mask) in enumerate(zip(saved_criteria, masks)):
+        if not saved['criteria']:
+            unresolved.append({
+                "query": saved['query'],
+                "filter_index": filter_index,
+                "reason": "Filter could not be resolved when the set was saved"
+            })
+            continue
+        filter_results.append({
+            "query": saved['query'],
+            "filter_index": filter_index,
+            "matches": store.matching_ids(mask)
+        })
+    return {
+        "all_matches": store.matching_ids(masks.any(axis=0)),
+        "filter_results": filter_results,
+        "unresolved": unresolved
+    }
+
+
+def fetch_land_use_at(longitude, latitude):
+    """Query the Socrata land use API for the polygon containing a point"""
+    # Socrata requires POINT(LONG LAT)
+    point_wkt = f"POINT({longitude} {latitude})"
+
+    logger.debug("Querying land use API for %s", point_wkt)
+    
+    # Socrata spatial query
+    query_params = {
+        "$where": f"intersects(the_geom, '{point_wkt}')",
+        "$limit": 1  # usually only one polygon contains the point
+    }
+
+    data = get_json(CALGARY_LAND_USE_API, query_params)
+    return data[0] if data else None  # return the first match
+
+
+def lookup_land_use(longitude, latitude):
+    """Find the land use record for a point, locally when the loaded layer covers it"""
+    try:
+        land_use_index = get_cached_land_use_index()
+    except Exception as e:
+        logger.warning("Land use layer unavailable, querying API directly: %s", e)
+        land_use_index = None
+
+    if land_use_index is not None and covers_point(land_use_index, longitude, latitude):
+        record = find_land_use_at(land_use_index, longitude, latitude)
+        # A miss is only authoritative when the whole layer was loaded
+        if record is not None or land_use_index.get('complete'):
+            return record
+
+    return fetch_land_use_at(longitude, latitude)
+
+
 @app.route('/api/land-use', methods=['GET'])
 def get_land_use():
     try:
@@ -299,25 +1001,12 @@ def get_land_use():
         longitude = float(request.args.get('lng'))
         latitude = float(request.args.get('lat'))
 
-        # Socrata requires POINT(LONG LAT)
-        point_wkt = f"POINT({longitude} {latitude})"
-
-        print(f"Querying land use API for: {point_wkt}")
-        
-        # Socrata spatial query
-        query_params = {
-            "$where": f"intersects(the_geom, '{point_wkt}')",
-            "$limit": 1  # usually only one polygon contains the point
-        }
-
-        response = requests.get(CALGARY_LAND_USE_API, params=query_params)
-        response.raise_for_status()
-        data = response.json()
+        record = lookup_land_use(longitude, latitude)
 
-        if data:
+        if record:
             return jsonify({
                 'status': 'success',
-                'data': data[0]  # return the first match
+                'data': record
             })
         else:
             return jsonify({
@@ -327,7 +1016,100 @@ def get_land_use():
             })
 
     except Exception as e:
-        print(f"Error in land use lookup: {e}")
+        logger.exception("Error in land use lookup")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/land-use/batch', methods=['POST'])
+def get_land_use_batch():
+    """Look up land use for many points in one request"""
+    try:
+        data = request.get_json() or {}
+        points = data.get('points', [])
+
+        if not isinstance(points, list):
+            return jsonify({'status': 'error', 'message': 'points must be a list'}), 400
+        if not points:
+            return jsonify({'status': 'error', 'message': 'No points provided'}), 400
+        if len(points) > LAND_USE_BATCH_LIMIT:
+            return jsonify({
+                'status': 'error',
+                'message': f'Too many points (maximum is {LAND_USE_BATCH_LIMIT})'
+            }), 400
+
+        # Accept either [lng, lat] pairs or {"lng": ..., "lat": ...} objects
+        longitudes = []
+        latitudes = []
+        for position, point in enumerate(points):
+            try:
+                longitude, latitude = parse_point(point)
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': f'Invalid point at position {position}: {e}'}), 400
+            longitudes.append(longitude)
+            latitudes.append(latitude)
+
+        results = [None] * len(points)
+        resolved = [False] * len(points)
+
+        try:
+            land_use_index = get_cached_land_use_index()
+        except Exception as e:
+            logger.warning("Land use layer unavailable, querying API directly: %s", e)
+            land_use_index = None
+
+        if land_use_index is not None:
+            # One vectorized point-in-polygon pass over the whole batch
+            covered = covers_points(land_use_index, longitudes, latitudes)
+            matches = find_land_use_many(land_use_index, longitudes, latitudes)
+            complete = land_use_index.get('complete')
+            for i, match in enumerate(matches):
+                if match >= 0:
+                    results[i] = land_use_index['records'][match]
+                    resolved[i] = True
+                elif covered[i] and complete:
+                    resolved[i] = True
+
+        # Anything the local layer can't answer goes to the API, once per distinct point.
+        # The lookups run concurrently under the upstream limit and are capped per batch
+        fallback_points = list(dict.fromkeys((longitudes[i], latitudes[i])
+                                             for i in range(len(points)) if not resolved[i]))
+        fallback_points = fallback_points[:LAND_USE_BATCH_FALLBACK_LIMIT]
+
+        def fetch_fallback(point):
+            try:
+                return point, fetch_land_use_at(*point)
+            except Exception as e:
+                logger.warning("Land use API lookup failed for %s: %s", point, e)
+                return point, None
+
+        fallback = {}
+        if fallback_points:
+            with ThreadPoolExecutor(max_workers=min(SOCRATA_MAX_CONCURRENCY, len(fallback_points))) as executor:
+                for point, record in executor.map(fetch_fallback, fallback_points):
+                    fallback[point] = record
+
+        unresolved = []
+        for i in range(len(points)):
+            if not resolved[i]:
+                key = (longitudes[i], latitudes[i])
+                if key in fallback:
+                    results[i] = fallback[key]
+                else:
+                    unresolved.append(i)
+
+        logger.debug("Batch land use lookup: %d points, %d API fallbacks, %d unresolved",
+                     len(points), len(fallback), len(unresolved))
+        return jsonify({
+            'status': 'success',
+            'data': results,
+            # Positions of points that got no answer (null in data) because of the fallback cap
+            'unresolved': unresolved
+        })
+
+    except Exception as e:
+        logger.exception("Error in batch land use lookup")
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -336,110 +1118,323 @@ def get_land_use():
 @app.route('/api/buildings-with-land-use')
 def buildings_with_land_use():
     """Get buildings with their land use codes in one request"""
-    downtown_bbox = {
-        "max_lat": 51.06,
-        "min_lat": 51.04,
-        "min_lng": -114.09,
-        "max_lng": -114.05
-    }
+    try:
+        bbox = request_bbox(request.args.get('bbox'))
+        lod = request_lod(request.args.get('zoom'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Get cached buildings (without land use initially)
-    buildings = get_cached_processed_buildings(limit=1000, bbox=downtown_bbox)
-    
-    print(f"Found {len(buildings)} buildings")
+    dataset = get_cached_dataset(limit=BUILDING_TILE_LIMIT, bbox=bbox)
+    buildings = dataset['buildings']
     
     try:
-        print(f"Fetching land use data from {CALGARY_LAND_USE_API}")
-        response = requests.get(CALGARY_LAND_USE_API, params={"$limit": 2000})
-        response.raise_for_status()
-        land_use_data = response.json()
-
-        # Preprocess: build a list of shapely multipolygons
-        land_use_polygons = []
-        for record in land_use_data:
-            if record and 'multipolygon' in record and record.get('lu_code'):
-                try:
-                    polygon = shape(record['multipolygon'])  # Convert GeoJSON to Shapely
-                    land_use_polygons.append({
-                        'geometry': polygon,
-                        'data': record
-                    })
-                except Exception as shape_error:
-                    print(f"Error parsing polygon: {shape_error}")
-                    continue
+        land_use_index = get_cached_land_use_index()
 
-        matched_count = 0
-        for building in buildings:
-            building['land_use'] = None
+        # Only redo the join when the land use layer has changed since the last one. The
+        # join goes into a copy that replaces the cache entry, so requests still reading
+        # the old one never see half-joined buildings
+        if dataset.get('land_use_version') != land_use_index['version']:
+            cache_key = buildings_cache_key(BUILDING_TILE_LIMIT, bbox)
+            dataset = cache_flights.do(('join', cache_key, land_use_index['version']),
+                                       lambda: swap_in_join(cache_key, dataset, land_use_index))
 
-            if building.get('polygon') and building['polygon'].get('coordinates'):
-                try:
-                    building_geom = shape(building['polygon'])
-                    centroid = building_geom.centroid
-
-                    # Find the first land use polygon containing the centroid
-                    for lu in land_use_polygons:
-                        if lu['geometry'].intersects(building_geom):
-                            building['land_use'] = {
-                                'lu_code': lu['data'].get('lu_code'),
-                                'description': lu['data'].get('description'),
-                                'label': lu['data'].get('label'),
-                                'major': lu['data'].get('major'),
-                                'generalize': lu['data'].get('generalize'),
-                            }
-                            matched_count += 1
-                            break
+        payload = get_json_payload(dataset, 'buildings_with_land_use', dataset['land_use_version'], lod)
+        return send_payload(payload)
 
+    except Exception:
+        logger.exception("Error joining land use data")
+        return jsonify([{**building, 'land_use': None} for building in buildings])
 
-                except Exception as e:
-                    print(f"Error processing building: {e}")
-                    continue
-
-        print(f"Matched {matched_count} buildings with land use data")
-        return jsonify(buildings)
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>.mvt')
+def vector_tile(z, x, y):
+    """Mapbox vector tile with a buildings layer (height, colour) and a land use layer"""
+    if not valid_tile(z, x, y):
+        return jsonify({"error": f"Invalid tile {z}/{x}/{y}"}), 400
 
+    try:
+        land_use_index = get_cached_land_use_index()
     except Exception as e:
-        print(f"Error fetching land use data: {e}")
-        for building in buildings:
-            building['land_use'] = None
-        return jsonify(buildings)
+        logger.warning("Land use layer unavailable, leaving it out of the tile: %s", e)
+        land_use_index = None
+
+    # A new land use layer changes the tile contents, so it is part of the key
+    cache_key = f"{z}/{x}/{y}@{land_use_index['version'] if land_use_index is not None else 0}"
+    payload = vector_tile_cache.get(cache_key)
+    if payload is None:
+        payload = cache_flights.do(('tile', cache_key), lambda: build_vector_tile(z, x, y, land_use_index, cache_key))
+    return send_payload(payload, mimetype='application/vnd.mapbox-vector-tile')
+
+
+def build_vector_tile(z, x, y, land_use_index, cache_key):
+    """Encode a tile and store its payload in the vector tile cache"""
+    payload = vector_tile_cache.peek(cache_key)
+    if payload is not None:
+        return payload
+
+    bbox = tile_bbox(z, x, y)
+    layers = []
+
+    if z >= TILE_MIN_BUILDING_ZOOM and count_grid_tiles(bbox, BUILDING_TILE_SIZE) <= MAX_VIEWPORT_TILES:
+        # Built straight from the cached raw grid tiles: a processed dataset per map tile
+        # would crowd the viewport entries the JSON endpoints serve out of processed_buildings_cache
+        with timed('upstream_fetch'):
+            raw_data = fetch_viewport_buildings(limit=BUILDING_TILE_LIMIT, bbox=bbox)
+        with timed('process_buildings'):
+            buildings, geometries = process_buildings(raw_data)
+        properties = [{
+            "id": building["id"],
+            "struct_id": building.get("struct_id"),
+            "height": float(building["height"]),
+            "colour": building["colour"]
+        } for building in buildings]
+        present = np.flatnonzero(~shapely.is_missing(geometries))
+        layers.append(("buildings", geometries[present], [properties[i] for i in present]))
+
+    if land_use_index is not None and len(land_use_index['records']):
+        tile_box = shapely.box(bbox['min_lng'], bbox['min_lat'], bbox['max_lng'], bbox['max_lat'])
+        parcels = np.sort(land_use_index['tree'].query(tile_box, predicate="intersects"))
+        records = land_use_index['records']
+        layers.append(("land_use", land_use_index['geometries'][parcels],
+                       [land_use_summary(records[i]) for i in parcels]))
+
+    with timed('tile_encode'):
+        payload = build_payload(encode_tile(z, x, y, layers))
+    vector_tile_cache.set(cache_key, payload)
+    logger.debug("Encoded tile %d/%d/%d: %d bytes", z, x, y, len(payload['identity']))
+    return payload
+
+
+def join_land_use(dataset, land_use_index):
+    """Copy of a dataset with land use joined onto fresh building records, leaving the served one untouched"""
+    with timed('land_use_join'):
+        buildings = [dict(building) for building in dataset['buildings']]
+        matched_count = assign_land_use(buildings, land_use_index, dataset_geometries(dataset))
+    logger.info("Matched %d buildings with land use data", matched_count)
+    joined = {**dataset, 'buildings': buildings, 'land_use_version': land_use_index['version'], 'payloads': {},
+              'land_use_fingerprint': land_use_index['fingerprint']}
+    get_json_payload(joined, 'buildings_with_land_use', joined['land_use_version'])
+    return joined
+
+
+def swap_in_join(cache_key, dataset, land_use_index):
+    """Join land use into a copy of a cached dataset and atomically replace the cache entry with it"""
+    joined = join_land_use(dataset, land_use_index)
+    processed_buildings_cache.replace(cache_key, joined)
+    return joined
+
+
+def refresh_caches():
+    """
+    Rebuild cache entries that are about to expire while requests keep being served
+    from the current ones. Only entries read within the last cache period are kept warm
+    """
+    land_use_time = land_use_cache['cache_time']
+    if land_use_time is not None and time.time() - land_use_time >= LAND_USE_CACHE_DURATION - CACHE_REFRESH_AHEAD:
+        logger.info("Refreshing land use layer in the background")
+        get_cached_land_use_index(refresh=True)
+
+    for key, dataset, expires_in, idle in processed_buildings_cache.entries():
+        if idle >= CACHE_DURATION:
+            continue
+
+        if expires_in <= CACHE_REFRESH_AHEAD:
+            logger.info("Refreshing buildings %s in the background", key)
+            fresh = build_dataset(limit=dataset['limit'], bbox=dataset['bbox'], refresh=True)
+            if dataset.get('land_use_version'):
+                fresh = join_land_use(fresh, get_cached_land_use_index())
+                save_dataset_snapshot(key, fresh)
+            processed_buildings_cache.set(key, fresh)
+        elif dataset.get('land_use_version') and dataset['land_use_version'] != land_use_cache['version']:
+            # The land use layer changed underneath a joined dataset, redo the join ahead of the next request
+            logger.info("Rejoining land use for buildings %s in the background", key)
+            joined = swap_in_join(key, dataset, get_cached_land_use_index())
+            save_dataset_snapshot(key, joined)
+
+
+def run_refresher():
+    while True:
+        time.sleep(CACHE_REFRESH_INTERVAL)
+        try:
+            refresh_caches()
+        except Exception:
+            logger.exception("Background cache refresh failed")
+
+
+refresher_thread = None
+
+
+def start_refresher():
+    """Start the background cache refresher thread for this process (once)"""
+    global refresher_thread
+    if CACHE_REFRESH_INTERVAL <= 0 or (refresher_thread is not None and refresher_thread.is_alive()):
+        return
+    refresher_thread = threading.Thread(target=run_refresher, name='cache-refresher', daemon=True)
+    refresher_thread.start()
+
+
+def prewarm():
+    """Load the land use layer and the downtown buildings (joined and serialized) into the caches"""
+    start = time.time()
+    try:
+        land_use_index = get_cached_land_use_index()
+        dataset = get_cached_dataset(limit=BUILDING_TILE_LIMIT, bbox=DOWNTOWN_BBOX)
+        # A snapshot made against the current land use layer is already joined
+        if dataset.get('land_use_version') != land_use_index['version']:
+            cache_key = buildings_cache_key(BUILDING_TILE_LIMIT, DOWNTOWN_BBOX)
+            joined = swap_in_join(cache_key, dataset, land_use_index)
+            save_dataset_snapshot(cache_key, joined)
+        else:
+            get_json_payload(dataset, 'buildings_with_land_use', dataset['land_use_version'])
+        logger.info("Prewarmed caches in %.1fs", time.time() - start)
+    except Exception:
+        # The app still works without a warm cache, the first request just pays for it
+        logger.exception("Cache prewarm failed")
+
 
 @app.route('/api/cache/clear', methods=['POST'])
 def clear_cache():
     """Clear the building cache - useful for development"""
-    global buildings_cache
-    buildings_cache = {
-        'raw_data': None,
-        'processed_data': None,
-        'cache_time': None,
-        'bbox': None
-    }
+    raw_buildings_cache.clear()
+    processed_buildings_cache.clear()
+    vector_tile_cache.clear()
+    if shared_buildings_cache is not None:
+        shared_buildings_cache.clear()
+        shared_land_use_cache.clear()
+    if SNAPSHOT_DIR and os.path.isdir(SNAPSHOT_DIR):
+        for name in os.listdir(SNAPSHOT_DIR):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(SNAPSHOT_DIR, name))
+    with land_use_lock:
+        land_use_cache['index'] = None
+        land_use_cache['cache_time'] = None
     return jsonify({'message': 'Cache cleared successfully'})
 
 @app.route('/api/cache/status', methods=['GET'])
 def cache_status():
     """Get cache status information"""
-    import time
     current_time = time.time()
     
     status = {
-        'has_raw_data': buildings_cache['raw_data'] is not None,
-        'has_processed_data': buildings_cache['processed_data'] is not None,
-        'cache_time': buildings_cache['cache_time'],
-        'bbox': buildings_cache['bbox'],
-        'cache_age_seconds': current_time - buildings_cache['cache_time'] if buildings_cache['cache_time'] else None,
         'cache_duration_seconds': CACHE_DURATION,
-        'is_cache_valid': (buildings_cache['cache_time'] is not None and 
-                          current_time - buildings_cache['cache_time'] < CACHE_DURATION)
+        'memory_budget': {'host_bytes': CACHE_MEMORY_BUDGET, 'workers': CACHE_WORKERS,
+                          'worker_bytes': WORKER_CACHE_BUDGET},
+        'raw_buildings': raw_buildings_cache.status(),
+        'processed_buildings': processed_buildings_cache.status(),
+        'vector_tiles': vector_tile_cache.status(),
+        'shared_raw_buildings': shared_buildings_cache.status() if shared_buildings_cache is not None else None,
+        'shared_land_use': shared_land_use_cache.status() if shared_land_use_cache is not None else None,
+        'single_flight': cache_flights.status(),
+        'profiling': profiling_status()
+    }
+
+    with land_use_lock:
+        land_use_index = land_use_cache['index']
+        land_use_time = land_use_cache['cache_time']
+    status['land_use'] = {
+        'has_data': land_use_index is not None,
+        'version': land_use_cache['version'],
+        'cache_time': land_use_time,
+        'cache_age_seconds': current_time - land_use_time if land_use_time else None,
+        'cache_duration_seconds': LAND_USE_CACHE_DURATION,
+        'is_cache_valid': (land_use_time is not None and
+                           current_time - land_use_time < LAND_USE_CACHE_DURATION),
+        'polygon_count': len(land_use_index['records']) if land_use_index else 0,
+        'memory_bytes': land_use_index['memory_bytes'] if land_use_index else 0
+    }
+
+    lookups = llm_cache_stats['hits'] + llm_cache_stats['misses']
+    status['llm'] = {
+        **llm_cache_stats,
+        'hit_ratio': llm_cache_stats['hits'] / lookups if lookups else None,
+        'entries': get_llm_cache_size(),
+        'max_entries': LLM_CACHE_MAX_ENTRIES,
+        'ttl_seconds': LLM_CACHE_TTL
+    }
+
+    # How queries were resolved: pattern fast path, LLM (incl. its cache) or not at all
+    total_extractions = sum(stats['count'] for stats in extraction_stats.values())
+    status['extraction_tiers'] = {
+        tier: {
+            'count': stats['count'],
+            'share': stats['count'] / total_extractions if total_extractions else None,
+            'avg_seconds': stats['seconds'] / stats['count'] if stats['count'] else None
+        }
+        for tier, stats in extraction_stats.items()
     }
-    
-    if buildings_cache['raw_data']:
-        status['raw_data_count'] = len(buildings_cache['raw_data'])
-    if buildings_cache['processed_data']:
-        status['processed_data_count'] = len(buildings_cache['processed_data'])
     
     return jsonify(status)
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Stage and request latency histograms plus cache counters in the Prometheus text format (per process)"""
+    caches = {
+        'raw_buildings': raw_buildings_cache,
+        'processed_buildings': processed_buildings_cache,
+        'vector_tiles': vector_tile_cache
+    }
+    cache_counts = {name: (cache.hits, cache.misses) for name, cache in caches.items()}
+    for name, shared_cache in (('shared_raw_buildings', shared_buildings_cache), ('shared_land_use', shared_land_use_cache)):
+        if shared_cache is not None:
+            cache_counts[name] = (shared_cache.hits, shared_cache.misses)
+    cache_counts['llm'] = (llm_cache_stats['hits'], llm_cache_stats['misses'])
+    flights = cache_flights.status()
+
+    lines = stage_seconds.render() + request_seconds.render()
+    lines += render_metric('calgary_cache_hits_total', 'counter', 'Cache lookups that found a live entry',
+                           [({'cache': name}, hits) for name, (hits, _) in cache_counts.items()])
+    lines += render_metric('calgary_cache_misses_total', 'counter', 'Cache lookups that found nothing or an expired entry',
+                           [({'cache': name}, misses) for name, (_, misses) in cache_counts.items()])
+    lines += render_metric('calgary_cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits',
+                           [({'cache': name}, hits / (hits + misses) if hits + misses else None)
+                            for name, (hits, misses) in cache_counts.items()])
+    lines += render_metric('calgary_cache_entries', 'gauge', 'Live entries in each in-memory cache',
+                           [({'cache': name}, len(cache)) for name, cache in caches.items()])
+    lines += render_metric('calgary_cache_evictions_total', 'counter', 'Entries evicted to stay within budget',
+                           [({'cache': name}, cache.evictions) for name, cache in caches.items()])
+    lines += render_metric('calgary_single_flight_calls_total', 'counter', 'Cache fills started',
+                           [({}, flights['calls'])])
+    lines += render_metric('calgary_single_flight_coalesced_total', 'counter', 'Cache misses that waited on a fill already running',
+                           [({}, flights['coalesced'])])
+    lines += render_metric('calgary_filter_extractions_total', 'counter', 'Filter queries resolved, by extraction tier',
+                           [({'tier': tier}, stats['count']) for tier, stats in extraction_stats.items()])
+    lines += render_metric('calgary_land_use_version', 'gauge', 'Version of the loaded land use layer',
+                           [({}, land_use_cache['version'])])
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiles', methods=['GET'])
+def profiles():
+    """Stored request profiles, newest first (needs profiling enabled and the X-Profile token)"""
+    if not profiling_authorized(request.headers.get('X-Profile', '')):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"profiles": list_profiles(), "status": profiling_status()})
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """
+    A stored profile as a cProfile stats file (for pstats or snakeviz), or with
+    ?format=text as a pstats report (sort=cumulative|tottime|calls, limit=N)
+    """
+    if not profiling_authorized(request.headers.get('X-Profile', '')):
+        return jsonify({"error": "Not found"}), 404
+    try:
+        path = profile_path(profile_id)
+        if request.args.get('format') == 'text':
+            report = profile_report(profile_id, request.args.get('sort', 'cumulative'),
+                                    int(request.args.get('limit', 50)))
+            return Response(report, mimetype='text/plain')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError:
+        return jsonify({"error": "Profile not found"}), 404
+
+    if not os.path.exists(path):
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{profile_id}.prof")
+
 # Filter management endpoints
 @app.route('/api/filters/save', methods=['POST'])
 def save_user_filters():
@@ -456,8 +1451,29 @@ def save_user_filters():
             return jsonify({"success": False, "error": "Filter name is required"}), 400
         if not filters_data:
             return jsonify({"success": False, "error": "Filters data is required"}), 400
+        try:
+            bbox = request_bbox(data.get('bbox'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        # Resolve the queries now and keep what they match, so loading the set needs no LLM call or scan
+        matches = None
+        queries = filter_queries(filters_data)
+        if queries:
+            try:
+                extracted, failed = extract_filters(queries, FILTER_EXTRACTION_DEADLINE)
+                # A query that only ran out of time isn't unresolvable, so rather than freeze it as
+                # unresolved the set is saved without matches and loads re-run its queries
+                if 'timeout' in failed.values():
+                    logger.info("Saving filters %r without matches, extraction timed out", filter_name)
+                else:
+                    dataset = get_cached_dataset(limit=BUILDING_TILE_LIMIT, bbox=bbox)
+                    matches, _ = compute_saved_matches(dataset, queries, [extracted.get(query) for query in queries])
+            except Exception as e:
+                # The queries are still worth saving without their matches
+                logger.warning("Could not resolve saved filters %r: %s", filter_name, e)
         
-        result = save_filters(username, filter_name, filters_data)
+        result = save_filters(username, filter_name, filters_data, matches)
         
         if result["success"]:
             return jsonify(result), 200
@@ -480,6 +1496,13 @@ def load_user_filters():
         if filter_name:
             # Load specific filter set
             result = load_filters(username, filter_name)
+            saved = result.pop("saved_matches", None)
+            if saved:
+                try:
+                    result["results"] = load_saved_results(username, filter_name, saved, request.args.get('bbox'))
+                except Exception as e:
+                    # The client can still run the queries itself
+                    logger.warning("Could not load saved results for %r: %s", filter_name, e)
         else:
             # Load all filter sets for user
             result = load_filters(username)
@@ -492,6 +1515,29 @@ def load_user_filters():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def load_saved_results(username, filter_name, saved, bbox_param=None):
+    """
+    Results of a saved filter set from its stored bitmap when the dataset it was evaluated
+    against is unchanged, otherwise re-evaluated from the stored criteria and stored again
+    """
+    # Without a bbox the set is shown where it was saved
+    bbox = request_bbox(bbox_param or saved['dataset_bbox'])
+    dataset = get_cached_dataset(limit=BUILDING_TILE_LIMIT, bbox=bbox)
+    store = dataset['store']
+    saved_criteria = saved['criteria']
+
+    if saved['dataset_version'] == dataset_version(dataset) and saved['building_count'] == len(store):
+        with timed('saved_matches'):
+            masks = unpack_matches(saved['match_bitmap'], len(saved_criteria), len(store))
+    else:
+        # Only the index lookups are redone, the criteria were resolved when the set was saved
+        logger.info("Saved filters %r are stale, re-evaluating against the current data", filter_name)
+        queries = [item['query'] for item in saved_criteria]
+        matches, masks = compute_saved_matches(dataset, queries, [item['criteria'] for item in saved_criteria])
+        update_filter_matches(username, filter_name, matches)
+
+    return saved_filter_results(store, saved_criteria, masks)
+
 @app.route('/api/filters/delete', methods=['DELETE'])
 def delete_user_filters():
     """Delete a filter set for a user"""
@@ -534,16 +1580,65 @@ def list_user_filters():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/filters/save-bulk', methods=['POST'])
+def save_user_filters_bulk():
+    """Save several filter sets for a user at once"""
+    try:
+        data = request.get_json()
+        username = data.get('username', '').strip()
+        filter_sets = data.get('filter_sets', {})
+        
+        if not username:
+            return jsonify({"success": False, "error": "Username is required"}), 400
+        if not filter_sets or not isinstance(filter_sets, dict):
+            return jsonify({"success": False, "error": "filter_sets must map filter names to filters"}), 400
+        if any(not name.strip() or not filters for name, filters in filter_sets.items()):
+            return jsonify({"success": False, "error": "Every filter set needs a name and filters"}), 400
+        
+        result = save_filters_bulk(username, {name.strip(): filters for name, filters in filter_sets.items()})
+        
+        if result["success"]:
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 500
+            
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/filters/delete-bulk', methods=['DELETE'])
+def delete_user_filters_bulk():
+    """Delete several filter sets for a user at once"""
+    try:
+        data = request.get_json()
+        username = data.get('username', '').strip()
+        filter_names = data.get('filter_names', [])
+        
+        if not username:
+            return jsonify({"success": False, "error": "Username is required"}), 400
+        if not filter_names or not isinstance(filter_names, list):
+            return jsonify({"success": False, "error": "filter_names must be a list of filter names"}), 400
+        
+        result = delete_filters_bulk(username, [str(name).strip() for name in filter_names])
+        
+        if result["success"]:
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 500
+            
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 if __name__ == "__main__":
     # Load environment variables
     debug_mode = os.getenv('FLASK_DEBUG', 'True').lower() in ['true', '1', 'yes']
     port = int(os.getenv('PORT', os.getenv('FLASK_PORT', 5050)))  # Render uses PORT env var
     host = os.getenv('HOST', '0.0.0.0')  # Bind to all interfaces for Render
     
-    print(f"Starting Flask app...")
-    print(f"Debug mode: {debug_mode}")
-    print(f"Host: {host}")
-    print(f"Port: {port}")
-    print(f"API Token configured: {'Yes' if CALGARY_APP_TOKEN else 'No'}")
+    logger.info("Starting Flask app (debug mode: %s, host: %s, port: %d, API token configured: %s)",
+                debug_mode, host, port, 'yes' if CALGARY_APP_TOKEN else 'no')
+
+    # With the reloader only the child process serves requests
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_refresher()
     
     app.run(debug=debug_mode, host=host, port=port)
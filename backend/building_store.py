@@ -0,0 +1,154 @@
+import math
+import zlib
+
+import numpy as np
+
+# Attributes the LLM is told it can filter on, parsed up front
+FILTER_ATTRIBUTES = ('height', 'rooftop_elev_z', 'grd_elev_min_z', 'grd_elev_max_z')
+
+# Comparison operators a filter may use, besides "between"
+OPERATORS = ('>', '<', '>=', '<=', '==', '!=')
+
+
+def parse_numeric(raw):
+    """Parse an attribute value the way filters always have ("12.5m" -> 12.5), NaN if it isn't a number"""
+    if raw is None:
+        return math.nan
+    if isinstance(raw, str):
+        raw = raw.lower().replace("m", "").strip()
+        if not raw.replace(".", "", 1).isdigit():
+            return math.nan
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class BuildingStore:
+    """
+    Column-oriented view of processed buildings for vectorized filtering, with a
+    sorted index per attribute so comparisons are answered by binary search
+    """
+
+    def __init__(self, buildings):
+        self.ids = np.array([building.get("id") for building in buildings], dtype=np.int64)
+        self._buildings = buildings
+        self._columns = {}
+        self._indexes = {}
+        for attribute in FILTER_ATTRIBUTES:
+            self.sorted_index(attribute)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, attribute):
+        """Float array of an attribute (NaN where missing or not numeric), parsed once and kept"""
+        values = self._columns.get(attribute)
+        if values is None:
+            values = np.fromiter((parse_numeric(building.get(attribute)) for building in self._buildings),
+                                 dtype=np.float64, count=len(self._buildings))
+            self._columns[attribute] = values
+        return values
+
+    def sorted_index(self, attribute):
+        """(sorted values, row positions) of an attribute's numeric values, NaNs left out"""
+        index = self._indexes.get(attribute)
+        if index is None:
+            values = self.column(attribute)
+            order = np.argsort(values, kind="stable")
+            # argsort puts NaN last, so the numeric values are a prefix
+            numeric_count = len(values) - int(np.isnan(values).sum())
+            order = order[:numeric_count]
+            index = (values[order], order)
+            self._indexes[attribute] = index
+        return index
+
+    def range_rows(self, attribute, lower=None, upper=None, include_lower=True, include_upper=True):
+        """Row positions whose value lies within the bounds (None = unbounded), found by binary search"""
+        sorted_values, order = self.sorted_index(attribute)
+        start = 0
+        end = len(sorted_values)
+        if lower is not None:
+            start = np.searchsorted(sorted_values, lower, side="left" if include_lower else "right")
+        if upper is not None:
+            end = np.searchsorted(sorted_values, upper, side="right" if include_upper else "left")
+        if end <= start:
+            return order[:0]
+        return order[start:end]
+
+    @property
+    def nbytes(self):
+        index_bytes = sum(values.nbytes + order.nbytes for values, order in self._indexes.values())
+        return self.ids.nbytes + index_bytes + sum(values.nbytes for values in self._columns.values())
+
+    def matching_ids(self, rows):
+        """Building IDs for row positions (or a boolean mask), in building order"""
+        if rows.dtype == bool:
+            return self.ids[rows].tolist()
+        return self.ids[np.sort(rows)].tolist()
+
+
+def parse_filter_value(value):
+    """Parse a filter value to a float, raising ValueError if it isn't a number"""
+    try:
+        number = float(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid value: {value!r}")
+    if math.isnan(number):
+        raise ValueError("Value must be a number")
+    return number
+
+
+def compile_filter(criteria):
+    """
+    Turn extracted {attribute, operator, value} criteria into a function that maps a
+    BuildingStore to the row positions that match. "between" takes a [low, high]
+    value (inclusive). Raises ValueError if the criteria aren't usable
+    """
+    if not isinstance(criteria, dict):
+        raise ValueError("Filter criteria must be an object")
+
+    attribute = criteria.get("attribute")
+    operator = criteria.get("operator")
+    if not isinstance(attribute, str) or not attribute:
+        raise ValueError(f"Invalid attribute: {attribute!r}")
+    if operator not in OPERATORS and operator != "between":
+        raise ValueError(f"Unsupported operator: {operator!r}")
+
+    if operator == "between":
+        bounds = criteria.get("value")
+        if not isinstance(bounds, (list, tuple)) or len(bounds) != 2:
+            raise ValueError("between needs a [low, high] value")
+        low, high = sorted(parse_filter_value(bound) for bound in bounds)
+        return lambda store: store.range_rows(attribute, lower=low, upper=high)
+
+    value = parse_filter_value(criteria.get("value"))
+
+    # Each comparison is one or two binary searches on the attribute's sorted index
+    if operator == ">":
+        return lambda store: store.range_rows(attribute, lower=value, include_lower=False)
+    if operator == ">=":
+        return lambda store: store.range_rows(attribute, lower=value)
+    if operator == "<":
+        return lambda store: store.range_rows(attribute, upper=value, include_upper=False)
+    if operator == "<=":
+        return lambda store: store.range_rows(attribute, upper=value)
+    if operator == "==":
+        return lambda store: store.range_rows(attribute, lower=value, upper=value)
+
+    # != is everything numeric on either side of the equal run
+    return lambda store: np.concatenate((
+        store.range_rows(attribute, upper=value, include_upper=False),
+        store.range_rows(attribute, lower=value, include_lower=False)
+    ))
+
+
+def pack_matches(masks):
+    """Compress a (filters, buildings) boolean match matrix into a bitmap blob"""
+    return zlib.compress(np.packbits(masks, axis=1).tobytes())
+
+
+def unpack_matches(blob, filter_count, building_count):
+    """Inverse of pack_matches"""
+    packed = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(filter_count, -1)
+    return np.unpackbits(packed, axis=1, count=building_count).astype(bool)
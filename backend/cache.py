@@ -0,0 +1,407 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+# Items serialized when estimating the size of a long list
+ESTIMATE_SAMPLE_SIZE = 64
+
+
+def estimate_json_bytes(value):
+    """
+    Approximate the size of JSON-like data by its serialized length. Long lists are
+    estimated from an evenly spaced sample so sizing stays cheap for big datasets
+    """
+    try:
+        if isinstance(value, list) and len(value) > ESTIMATE_SAMPLE_SIZE:
+            step = len(value) / ESTIMATE_SAMPLE_SIZE
+            sample = [value[int(i * step)] for i in range(ESTIMATE_SAMPLE_SIZE)]
+            return len(json.dumps(sample)) * len(value) // ESTIMATE_SAMPLE_SIZE
+        return len(json.dumps(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL and an entry count / byte budget"""
+
+    def __init__(self, name, max_entries=32, max_bytes=None, ttl=3600, sizeof=estimate_json_bytes):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> {'value', 'size', 'cache_time', 'ttl', 'last_used'}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if time.time() - entry['cache_time'] >= entry['ttl']:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            entry['last_used'] = time.time()
+            self.hits += 1
+            return entry['value']
+
+    def peek(self, key):
+        """Like get, but without counting a hit or miss or marking the entry as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry['cache_time'] >= entry['ttl']:
+                return None
+            return entry['value']
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting least recently used entries to stay within budget"""
+        size = self.sizeof(value) if self.sizeof else 0
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # Something bigger than the whole budget would just flush everything else out
+            if self.max_bytes is not None and size > self.max_bytes:
+                logger.warning("[%s] Not caching %s: %d bytes exceeds budget of %d", self.name, key, size, self.max_bytes)
+                return
+
+            current_time = time.time()
+            self._entries[key] = {
+                'value': value,
+                'size': size,
+                'cache_time': current_time,
+                'ttl': ttl if ttl is not None else self.ttl,
+                'last_used': current_time
+            }
+            self._bytes += size
+            self._evict()
+
+    def resize(self, key, value):
+        """
+        Re-measure key's entry after value grew in place, evicting others to stay within
+        budget. Does nothing if key is gone or now holds a different value
+        """
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['value'] is not value:
+                return
+            self._bytes += size - entry['size']
+            entry['size'] = size
+            self._evict()
+
+    def _evict(self):
+        while (len(self._entries) > self.max_entries or
+               (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+            logger.debug("[%s] Evicted %s", self.name, oldest_key)
+
+    def replace(self, key, value):
+        """Swap in a new value for key, keeping the entry's age and TTL (stored fresh if key is gone)"""
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['cache_time'] < entry['ttl']:
+                self._bytes += size - entry['size']
+                self._entries[key] = {**entry, 'value': value, 'size': size}
+                self._evict()
+                return
+        self.set(key, value)
+
+    def entries(self):
+        """(key, value, seconds until expiry, seconds since last read) for each live entry"""
+        current_time = time.time()
+        with self._lock:
+            return [
+                (key, entry['value'], entry['cache_time'] + entry['ttl'] - current_time,
+                 current_time - entry['last_used'])
+                for key, entry in self._entries.items()
+                if current_time - entry['cache_time'] < entry['ttl']
+            ]
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+    def __len__(self):
+        return len(self._entries)
+
+    def status(self):
+        """Summary of the cache contents and hit/miss/eviction counters"""
+        current_time = time.time()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'keys': [
+                    {
+                        'key': key,
+                        'bytes': entry['size'],
+                        'cache_age_seconds': current_time - entry['cache_time'],
+                        'is_cache_valid': current_time - entry['cache_time'] < entry['ttl']
+                    }
+                    for key, entry in self._entries.items()
+                ]
+            }
+
+
+class SharedCache:
+    """
+    JSON cache in a SQLite file shared by every worker process on the host. A miss takes a
+    short lease on the key, so one worker fetches while the others wait for its result
+    """
+
+    def __init__(self, path, name, ttl=3600, lease_seconds=60, poll_interval=0.1):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.waits = 0
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        try:
+            # WAL lets readers in other workers carry on while one of them writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shared_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shared_cache_leases (
+                    cache_key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _key(self, key):
+        return f"{self.name}:{key}"
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key, max_age=None):
+        """Return the stored value for key, or None if it is missing, expired or older than max_age"""
+        current_time = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value, created_at FROM shared_cache WHERE cache_key = ? AND expires_at > ?",
+                (self._key(key), current_time)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None or (max_age is not None and current_time - row[1] > max_age):
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, value, ttl=None):
+        """Store value under key and drop anything that has expired"""
+        blob = zlib.compress(json.dumps(value).encode("utf-8"), 6)
+        current_time = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO shared_cache (cache_key, value, created_at, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    value = excluded.value, created_at = excluded.created_at, expires_at = excluded.expires_at
+            """, (self._key(key), blob, current_time, current_time + (ttl if ttl is not None else self.ttl)))
+            conn.execute("DELETE FROM shared_cache WHERE expires_at <= ?", (current_time,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _acquire_lease(self, key, owner):
+        current_time = time.time()
+        conn = self._connect()
+        try:
+            # Only take the lease if nobody holds it or the holder's lease ran out
+            cursor = conn.execute("""
+                INSERT INTO shared_cache_leases (cache_key, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE shared_cache_leases.expires_at <= ?
+            """, (self._key(key), owner, current_time + self.lease_seconds, current_time))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def _release_lease(self, key, owner):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM shared_cache_leases WHERE cache_key = ? AND owner = ?",
+                         (self._key(key), owner))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_or_fetch(self, key, fetch, max_age=None):
+        """
+        Return the stored value for key (no older than max_age), otherwise call fetch() and store
+        the result. When another worker is already fetching the key this waits for its result
+        instead, and only fetches itself if that worker's lease runs out
+        """
+        value = self.get(key, max_age)
+        if value is not None:
+            self._count('hits')
+            return value
+        self._count('misses')
+
+        owner = f"{os.getpid()}-{threading.get_ident()}"
+        waited = False
+        while True:
+            if self._acquire_lease(key, owner):
+                try:
+                    # Whoever held the lease before may have just stored the value
+                    value = self.get(key, max_age)
+                    if value is None:
+                        self._count('fetches')
+                        value = fetch()
+                        self.set(key, value)
+                    return value
+                finally:
+                    self._release_lease(key, owner)
+
+            if not waited:
+                self._count('waits')
+                waited = True
+            time.sleep(self.poll_interval)
+            value = self.get(key, max_age)
+            if value is not None:
+                return value
+
+    def clear(self):
+        """Drop every entry of this cache"""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM shared_cache WHERE cache_key LIKE ?", (f"{self.name}:%",))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def status(self):
+        """Entry count and size on disk plus this process's hit/miss/fetch/wait counters"""
+        current_time = time.time()
+        conn = self._connect()
+        try:
+            entries, blob_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM shared_cache "
+                "WHERE cache_key LIKE ? AND expires_at > ?",
+                (f"{self.name}:%", current_time)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path,
+            'entries': entries,
+            'compressed_bytes': blob_bytes,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+            'fetches': self.fetches,
+            'waits': self.waits
+        }
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller runs the
+    function and everyone who asks for that key while it runs gets its result (or error)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Run fn() for key, or wait for the call already running for it"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def status(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'calls': self.calls, 'coalesced': self.coalesced}
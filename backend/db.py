@@ -1,15 +1,65 @@
 import sqlite3
 import json
+import logging
 import os
+import threading
+import time
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # Database file path
 DB_PATH = os.path.join(os.path.dirname(__file__), 'filters.db')
 
+# Persistent cache of LLM query -> filter extraction results
+LLM_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'llm_cache.db')
+
+# Columns holding a saved filter set's resolved criteria and its matches on the dataset
+# it was last evaluated against
+SAVED_MATCH_COLUMNS = (
+    ('criteria', 'TEXT'),
+    ('match_bitmap', 'BLOB'),
+    ('building_count', 'INTEGER'),
+    ('dataset_bbox', 'TEXT'),
+    ('dataset_version', 'TEXT'),
+)
+
+# Milliseconds a connection waits on another worker's write lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+# One open connection per thread and database file, reused across calls
+_connections = threading.local()
+
+def get_connection(path=None):
+    """
+    Pooled connection to a database file for the calling thread, opened once with
+    WAL and tuned pragmas. Connections inherited across a fork are not reused
+    """
+    pool = getattr(_connections, 'pool', None)
+    if pool is None or _connections.pid != os.getpid():
+        pool = _connections.pool = {}
+        _connections.pid = os.getpid()
+
+    path = path or DB_PATH
+    conn = pool.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        # WAL lets readers run alongside a writer from another worker, and with it
+        # NORMAL sync is still safe against corruption
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-8192')  # 8 MB page cache
+        pool[path] = conn
+    return conn
+
 def init_db():
     """Initialize the database with required tables"""
+    # A throwaway connection, so nothing opened here is inherited by forked workers
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
     
     # Create filters table
     cursor.execute('''
@@ -19,51 +69,68 @@ def init_db():
             filter_name TEXT NOT NULL,
             filters_data TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            criteria TEXT,
+            match_bitmap BLOB,
+            building_count INTEGER,
+            dataset_bbox TEXT,
+            dataset_version TEXT,
+            UNIQUE (username, filter_name)
         )
     ''')
-    
-    # Create index for faster lookups
+
+    # Older tables get the resolved criteria and cached match columns added
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(saved_filters)')}
+    for column, column_type in SAVED_MATCH_COLUMNS:
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE saved_filters ADD COLUMN {column} {column_type}')
+
+    # Tables created before the UNIQUE constraint get it as an index instead, keeping
+    # the most recent row of any duplicates that the old SELECT-then-INSERT let in
     cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_username ON saved_filters(username)
+        DELETE FROM saved_filters
+        WHERE id NOT IN (SELECT MAX(id) FROM saved_filters GROUP BY username, filter_name)
     ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_saved_filters_user_name ON saved_filters(username, filter_name)
+    ''')
+
+    # The unique index covers lookups by username, so the old index is redundant
+    cursor.execute('DROP INDEX IF EXISTS idx_username')
     
     conn.commit()
     conn.close()
-    print(f"Database initialized at {DB_PATH}")
+    logger.info("Database initialized at %s", DB_PATH)
 
-def save_filters(username, filter_name, filters_data):
-    """Save filters for a user"""
-    conn = sqlite3.connect(DB_PATH)
+def save_filters(username, filter_name, filters_data, matches=None):
+    """
+    Save filters for a user. matches optionally holds the resolved criteria and match
+    bitmap ({criteria, match_bitmap, building_count, dataset_bbox, dataset_version})
+    """
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
         # Convert filters_data to JSON string
         filters_json = json.dumps(filters_data)
         
-        # Check if filter name already exists for this user
+        # Insert, or update the existing set in the same statement. updated_at gets
+        # millisecond precision on update, so it never equals created_at afterwards
         cursor.execute('''
-            SELECT id FROM saved_filters 
-            WHERE username = ? AND filter_name = ?
-        ''', (username, filter_name))
-        
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing filter
-            cursor.execute('''
-                UPDATE saved_filters 
-                SET filters_data = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE username = ? AND filter_name = ?
-            ''', (filters_json, username, filter_name))
-            action = "updated"
-        else:
-            # Insert new filter
-            cursor.execute('''
-                INSERT INTO saved_filters (username, filter_name, filters_data)
-                VALUES (?, ?, ?)
-            ''', (username, filter_name, filters_json))
-            action = "saved"
+            INSERT INTO saved_filters (username, filter_name, filters_data, criteria, match_bitmap,
+                                       building_count, dataset_bbox, dataset_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (username, filter_name) DO UPDATE SET
+                filters_data = excluded.filters_data,
+                criteria = excluded.criteria,
+                match_bitmap = excluded.match_bitmap,
+                building_count = excluded.building_count,
+                dataset_bbox = excluded.dataset_bbox,
+                dataset_version = excluded.dataset_version,
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            RETURNING updated_at != created_at
+        ''', (username, filter_name, filters_json, *saved_match_values(matches)))
+        action = "updated" if cursor.fetchone()[0] else "saved"
         
         conn.commit()
         return {"success": True, "action": action, "message": f"Filters {action} successfully"}
@@ -71,19 +138,77 @@ def save_filters(username, filter_name, filters_data):
     except Exception as e:
         conn.rollback()
         return {"success": False, "error": str(e)}
-    finally:
-        conn.close()
+
+def saved_match_values(matches):
+    """Column values for SAVED_MATCH_COLUMNS (all NULL without matches)"""
+    if not matches:
+        return (None,) * len(SAVED_MATCH_COLUMNS)
+    return (
+        json.dumps(matches['criteria']),
+        matches['match_bitmap'],
+        matches['building_count'],
+        json.dumps(matches['dataset_bbox']),
+        matches['dataset_version'],
+    )
+
+def update_filter_matches(username, filter_name, matches):
+    """Replace the cached matches of a saved filter set, e.g. after re-evaluating it on new data"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('''
+            UPDATE saved_filters
+            SET criteria = ?, match_bitmap = ?, building_count = ?, dataset_bbox = ?, dataset_version = ?
+            WHERE username = ? AND filter_name = ?
+        ''', (*saved_match_values(matches), username, filter_name))
+        conn.commit()
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        logger.warning("Error updating saved filter matches: %s", e)
+        return False
+
+def save_filters_bulk(username, filter_sets):
+    """Save several filter sets for a user in one transaction. filter_sets maps filter name -> filters"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # Bulk saves don't resolve the queries, so matches stored for an earlier version
+    # of a set have to go rather than be served for the new queries
+    clear_matches = ''.join(f"{column} = NULL, " for column, _ in SAVED_MATCH_COLUMNS)
+
+    try:
+        cursor.executemany(f'''
+            INSERT INTO saved_filters (username, filter_name, filters_data)
+            VALUES (?, ?, ?)
+            ON CONFLICT (username, filter_name) DO UPDATE SET
+                filters_data = excluded.filters_data,
+                {clear_matches}
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        ''', [(username, filter_name, json.dumps(filters_data))
+              for filter_name, filters_data in filter_sets.items()])
+
+        conn.commit()
+        return {"success": True, "saved": len(filter_sets),
+                "message": f"{len(filter_sets)} filter sets saved successfully"}
+
+    except Exception as e:
+        conn.rollback()
+        return {"success": False, "error": str(e)}
 
 def load_filters(username, filter_name=None):
     """Load filters for a user"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
         if filter_name:
             # Load specific filter set
             cursor.execute('''
-                SELECT filter_name, filters_data, created_at, updated_at
+                SELECT filter_name, filters_data, created_at, updated_at,
+                       criteria, match_bitmap, building_count, dataset_bbox, dataset_version
                 FROM saved_filters 
                 WHERE username = ? AND filter_name = ?
             ''', (username, filter_name))
@@ -95,7 +220,15 @@ def load_filters(username, filter_name=None):
                     "filter_name": result[0],
                     "filters": json.loads(result[1]),
                     "created_at": result[2],
-                    "updated_at": result[3]
+                    "updated_at": result[3],
+                    # Not JSON serializable (the bitmap is bytes); the caller decodes it
+                    "saved_matches": {
+                        "criteria": json.loads(result[4]),
+                        "match_bitmap": result[5],
+                        "building_count": result[6],
+                        "dataset_bbox": json.loads(result[7]),
+                        "dataset_version": result[8]
+                    } if result[5] is not None else None
                 }
             else:
                 return {"success": False, "error": "Filter set not found"}
@@ -122,12 +255,10 @@ def load_filters(username, filter_name=None):
             
     except Exception as e:
         return {"success": False, "error": str(e)}
-    finally:
-        conn.close()
 
 def delete_filters(username, filter_name):
     """Delete a filter set for a user"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -140,17 +271,37 @@ def delete_filters(username, filter_name):
             conn.commit()
             return {"success": True, "message": "Filter set deleted successfully"}
         else:
+            # Nothing to undo, but the pooled connection must not keep the transaction open
+            conn.rollback()
             return {"success": False, "error": "Filter set not found"}
             
     except Exception as e:
         conn.rollback()
         return {"success": False, "error": str(e)}
-    finally:
-        conn.close()
+
+def delete_filters_bulk(username, filter_names):
+    """Delete several filter sets for a user in one transaction, returns how many existed"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany('''
+            DELETE FROM saved_filters
+            WHERE username = ? AND filter_name = ?
+        ''', [(username, filter_name) for filter_name in filter_names])
+        deleted = cursor.rowcount
+
+        conn.commit()
+        return {"success": True, "deleted": deleted,
+                "message": f"{deleted} filter sets deleted successfully"}
+
+    except Exception as e:
+        conn.rollback()
+        return {"success": False, "error": str(e)}
 
 def get_user_filter_names(username):
     """Get all filter names for a user"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -167,8 +318,101 @@ def get_user_filter_names(username):
         
     except Exception as e:
         return {"success": False, "error": str(e)}
-    finally:
-        conn.close()
+
+def init_llm_cache():
+    """Initialize the LLM extraction cache database"""
+    conn = sqlite3.connect(LLM_CACHE_PATH)
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_filter_cache (
+            query_key TEXT PRIMARY KEY,
+            criteria TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hit_count INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Used to find the least recently used entries when trimming
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_filter_cache(last_used_at)
+    ''')
+
+    conn.commit()
+    conn.close()
+    logger.info("LLM cache initialized at %s", LLM_CACHE_PATH)
+
+def get_cached_filter(query_key, ttl):
+    """Get cached filter criteria for a normalized query, or None if missing or older than ttl seconds"""
+    conn = get_connection(LLM_CACHE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        now = time.time()
+        cursor.execute('''
+            SELECT criteria FROM llm_filter_cache
+            WHERE query_key = ? AND created_at > ?
+        ''', (query_key, now - ttl))
+        result = cursor.fetchone()
+
+        if not result:
+            return None
+
+        cursor.execute('''
+            UPDATE llm_filter_cache
+            SET last_used_at = ?, hit_count = hit_count + 1
+            WHERE query_key = ?
+        ''', (now, query_key))
+        conn.commit()
+        return json.loads(result[0])
+
+    except Exception as e:
+        conn.rollback()
+        logger.warning("Error reading LLM cache: %s", e)
+        return None
+
+def put_cached_filter(query_key, criteria, max_entries):
+    """Store filter criteria for a normalized query, trimming least recently used entries past max_entries"""
+    conn = get_connection(LLM_CACHE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        now = time.time()
+        cursor.execute('''
+            INSERT OR REPLACE INTO llm_filter_cache (query_key, criteria, created_at, last_used_at)
+            VALUES (?, ?, ?, ?)
+        ''', (query_key, json.dumps(criteria), now, now))
+
+        cursor.execute('''
+            DELETE FROM llm_filter_cache
+            WHERE query_key IN (
+                SELECT query_key FROM llm_filter_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (max_entries,))
+
+        conn.commit()
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        logger.warning("Error writing LLM cache: %s", e)
+        return False
+
+def get_llm_cache_size():
+    """Number of entries in the LLM extraction cache"""
+    conn = get_connection(LLM_CACHE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('SELECT COUNT(*) FROM llm_filter_cache')
+        return cursor.fetchone()[0]
+    except Exception as e:
+        logger.warning("Error reading LLM cache: %s", e)
+        return None
 
 # Initialize database when module is imported
 if __name__ == "__main__":
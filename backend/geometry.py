@@ -0,0 +1,200 @@
+import json
+import logging
+from itertools import chain
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+logger = logging.getLogger(__name__)
+
+
+def flatten_polygons(polygons):
+    """
+    Flatten GeoJSON Polygons into one coordinate array for bulk numpy/shapely work.
+
+    Returns (coords, ring_offsets, ring_polygon, ring_is_shell) where coords is an
+    (n, 2) float array, ring_offsets[i] is where ring i starts in coords, ring_polygon[i]
+    is the position of its polygon in the input and ring_is_shell marks outer rings.
+    Missing, empty or non-Polygon inputs contribute no rings. Raises ValueError if the
+    coordinates aren't all (x, y) pairs
+    """
+    rings = []
+    ring_polygon = []
+    ring_is_shell = []
+    for i, polygon in enumerate(polygons):
+        if not polygon or polygon.get("type", "Polygon") != "Polygon":
+            continue
+        coordinates = polygon.get("coordinates")
+        if not coordinates:
+            continue
+        for ring_number, ring in enumerate(coordinates):
+            if ring:
+                rings.append(ring)
+                ring_polygon.append(i)
+                ring_is_shell.append(ring_number == 0)
+
+    ring_lengths = np.fromiter(map(len, rings), dtype=np.int64, count=len(rings))
+    ring_offsets = np.zeros(len(rings), dtype=np.int64)
+    if len(rings):
+        ring_offsets[1:] = np.cumsum(ring_lengths)[:-1]
+
+    # Pull every coordinate out in one pass instead of building a list per ring
+    vertex_count = int(ring_lengths.sum())
+    coords = np.fromiter(chain.from_iterable(chain.from_iterable(rings)), dtype=np.float64)
+    if coords.size != vertex_count * 2:
+        raise ValueError("Polygon coordinates are not all (x, y) pairs")
+
+    return (coords.reshape(-1, 2), ring_offsets,
+            np.array(ring_polygon, dtype=np.int64), np.array(ring_is_shell, dtype=bool))
+
+
+def shell_means(polygons, flattened=None):
+    """
+    Mean of each Polygon's outer ring vertices (the closing vertex included), as
+    (x, y, has_shell) arrays; x and y are 0 where has_shell is False. flattened is
+    flatten_polygons(polygons) if the caller already has it. Raises ValueError like
+    flatten_polygons.
+
+    Rings of the same length are added up together, one vertex position at a time in
+    ring order, so each mean comes out bit-for-bit equal to sum(values) / len(values)
+    """
+    x = np.zeros(len(polygons), dtype=np.float64)
+    y = np.zeros(len(polygons), dtype=np.float64)
+    has_shell = np.zeros(len(polygons), dtype=bool)
+    if len(polygons) == 0:
+        return x, y, has_shell
+
+    coords, ring_offsets, ring_polygon, ring_is_shell = flattened or flatten_polygons(polygons)
+    ring_ends = np.append(ring_offsets[1:], len(coords))
+    starts = ring_offsets[ring_is_shell]
+    lengths = (ring_ends - ring_offsets)[ring_is_shell]
+    owners = ring_polygon[ring_is_shell]
+
+    xs = np.ascontiguousarray(coords[:, 0])
+    ys = np.ascontiguousarray(coords[:, 1])
+    for length in np.unique(lengths).tolist():
+        group = lengths == length
+        # (length, rings) vertex positions; reducing over axis 0 adds row after row
+        positions = starts[group] + np.arange(length)[:, None]
+        x[owners[group]] = np.add.reduce(xs[positions], axis=0) / length
+        y[owners[group]] = np.add.reduce(ys[positions], axis=0) / length
+    has_shell[owners] = True
+    return x, y, has_shell
+
+
+def polygons_to_geometries(polygons, flattened=None):
+    """
+    Bulk-convert GeoJSON Polygons to a shapely array (None where missing or invalid).
+    flattened is flatten_polygons(polygons) if the caller already has it
+    """
+    geometries = np.empty(len(polygons), dtype=object)
+    if len(polygons) == 0:
+        return geometries
+
+    try:
+        coords, ring_offsets, ring_polygon, ring_is_shell = flattened or flatten_polygons(polygons)
+    except ValueError:
+        # Coordinates with z values can't go into the (x, y) array
+        return _shape_each(polygons, geometries)
+
+    lengths = np.diff(np.append(ring_offsets, len(coords)))
+    # A polygon is only built if all of its rings are long enough and it has a shell
+    invalid = np.zeros(len(polygons), dtype=bool)
+    invalid[ring_polygon[lengths < 4]] = True
+    has_shell = np.zeros(len(polygons), dtype=bool)
+    has_shell[ring_polygon[ring_is_shell]] = True
+    keep_ring = ~invalid[ring_polygon] & has_shell[ring_polygon]
+
+    if keep_ring.any():
+        coord_ring = np.repeat(np.arange(len(ring_offsets)), lengths)
+        keep_coord = keep_ring[coord_ring]
+        # Renumber the kept rings so linearrings() gets consecutive indices
+        ring_numbers = np.cumsum(keep_ring) - 1
+        rings = shapely.linearrings(coords[keep_coord], indices=ring_numbers[coord_ring[keep_coord]])
+        shapely.polygons(rings, indices=ring_polygon[keep_ring], out=geometries)
+
+    # Anything that isn't a plain Polygon goes through shapely's GeoJSON parser
+    for i, polygon in enumerate(polygons):
+        if geometries[i] is None and polygon and polygon.get("coordinates") and polygon.get("type", "Polygon") != "Polygon":
+            try:
+                geometries[i] = shape(polygon)
+            except Exception as e:
+                logger.warning("Error processing building: %s", e)
+    return geometries
+
+
+def _shape_each(polygons, geometries):
+    for i, polygon in enumerate(polygons):
+        if polygon and polygon.get("coordinates"):
+            try:
+                geometries[i] = shape(polygon)
+            except Exception as e:
+                logger.warning("Error processing building: %s", e)
+    return geometries
+
+
+# Level-of-detail bands for building output: (minimum zoom, simplify tolerance in degrees,
+# decimal places kept). The top band sends geometries untouched
+LOD_BANDS = (
+    (17, None, None),
+    (15, 0.000005, 6),
+    (13, 0.00002, 5),
+    (0, 0.0001, 4),
+)
+
+
+def lod_band(zoom):
+    """Level-of-detail band for a map zoom"""
+    for band in LOD_BANDS:
+        if zoom >= band[0]:
+            return band
+    return LOD_BANDS[-1]
+
+
+def simplify_to_polygons(geometries, tolerance, decimals):
+    """
+    Topology-preserving simplification of a shapely array, returned as GeoJSON
+    dicts with coordinates snapped to decimals (None where missing)
+    """
+    simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    # Rounding coordinates on their own can fold small footprints into invalid slivers,
+    # so snap to the grid in a way that keeps the output valid
+    snapped = shapely.set_precision(simplified, 10.0 ** -decimals, mode="valid_output")
+
+    # Footprints smaller than a grid cell snap to nothing; those keep their simplified shape
+    present = ~shapely.is_missing(simplified)
+    degenerate = present & (shapely.is_empty(snapped) | (shapely.area(snapped) == 0) | ~shapely.is_valid(snapped))
+    polygons = geometries_to_polygons(np.where(degenerate, None, snapped), decimals)
+    fallback = np.flatnonzero(degenerate)
+    if len(fallback):
+        for position, polygon in zip(fallback.tolist(), geometries_to_polygons(simplified[fallback])):
+            polygons[position] = polygon
+    return polygons
+
+
+def geometries_to_polygons(geometries, decimals=None):
+    """Shapely array to GeoJSON dicts, optionally rounding coordinates (None where missing)"""
+    polygons = [None] * len(geometries)
+
+    def round_coords(coords):
+        return coords if decimals is None else np.round(coords, decimals)
+
+    # Plain polygons come out of one ragged array, rounded in bulk
+    polygon_positions = np.flatnonzero(shapely.get_type_id(geometries) == shapely.GeometryType.POLYGON)
+    if len(polygon_positions):
+        _, coords, (ring_offsets, polygon_offsets) = shapely.to_ragged_array(geometries[polygon_positions])
+        coords = round_coords(coords).tolist()
+        ring_offsets = ring_offsets.tolist()
+        polygon_offsets = polygon_offsets.tolist()
+        for n, position in enumerate(polygon_positions.tolist()):
+            polygons[position] = {
+                "type": "Polygon",
+                "coordinates": [coords[ring_offsets[ring]:ring_offsets[ring + 1]]
+                                for ring in range(polygon_offsets[n], polygon_offsets[n + 1])]
+            }
+
+    for position, geometry in enumerate(geometries):
+        if polygons[position] is None and geometry is not None:
+            polygons[position] = json.loads(shapely.to_geojson(shapely.transform(geometry, round_coords)))
+    return polygons
@@ -1,9 +1,41 @@
+import os
+
 bind = "0.0.0.0:10000"
-workers = 2
-worker_class = "sync"
-worker_connections = 1000
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+# The app splits CACHE_MEMORY_BUDGET between the workers; the config is read before
+# the preloaded app is imported, so it sees this
+os.environ['GUNICORN_WORKERS'] = str(workers)
+# Threaded workers, so a request waiting on Socrata or the LLM holds one thread
+# instead of the whole worker. Greenlet workers (gevent/eventlet) are not supported:
+# with preload_app the app's locks and semaphores are created before the worker
+# could monkey-patch them, so one blocked wait would stall every request in it
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
 timeout = 30
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 100
 preload_app = True
+
+
+def when_ready(server):
+    # With preload_app the app is already imported in the master, so warming its
+    # caches here means every forked worker starts with them
+    from app import prewarm
+    import socrata
+    prewarm()
+    # Workers get fresh sessions in post_fork; the master's pooled connections aren't needed anymore
+    socrata.session.close()
+
+
+def post_fork(server, worker):
+    # Keep-alive sockets opened in the master (by prewarm) must not be shared between
+    # processes, so each worker starts with its own HTTP sessions
+    import socrata
+    import llm
+    socrata.reset_session()
+    llm.reset_llm_session()
+
+    # Threads don't survive fork, so each worker starts its own refresher
+    from app import start_refresher
+    start_refresher()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from geometry import polygons_to_geometries
+
+logger = logging.getLogger(__name__)
+
+
+def land_use_summary(record):
+    """Pick the land use fields that are attached to each building"""
+    return {
+        'lu_code': record.get('lu_code'),
+        'description': record.get('description'),
+        'label': record.get('label'),
+        'major': record.get('major'),
+        'generalize': record.get('generalize'),
+    }
+
+
+def build_land_use_index(land_use_data):
+    """Parse land use records into shapely geometries and an STRtree over them"""
+    geometries = []
+    records = []
+    for record in land_use_data:
+        if record and 'multipolygon' in record and record.get('lu_code'):
+            try:
+                geometries.append(shape(record['multipolygon']))  # Convert GeoJSON to Shapely
+                records.append(record)
+            except Exception as shape_error:
+                logger.warning("Error parsing polygon: %s", shape_error)
+                continue
+
+    geometries = np.array(geometries, dtype=object)
+    shapely.prepare(geometries)
+
+    index = {
+        'geometries': geometries,
+        'records': records,
+        'tree': shapely.STRtree(geometries),
+        # (min_lng, min_lat, max_lng, max_lat) covered by the loaded polygons
+        'extent': tuple(shapely.total_bounds(geometries)) if len(geometries) else None,
+    }
+    index['memory_bytes'] = estimate_index_bytes(index)
+    # Identifies the layer's content across processes and restarts, unlike the cache version counter
+    index['fingerprint'] = hashlib.blake2b(json.dumps(records, sort_keys=True).encode('utf-8'),
+                                           digest_size=16).hexdigest()
+    return index
+
+
+def estimate_index_bytes(index):
+    """Rough memory footprint of a land use index (coordinates, tree nodes and records)"""
+    geometries = index['geometries']
+    # 16 bytes per 2D coordinate plus a fixed per-geometry overhead for GEOS objects,
+    # the prepared geometry and the tree node
+    coordinate_bytes = int(shapely.get_num_coordinates(geometries).sum()) * 16 if len(geometries) else 0
+    geometry_bytes = len(geometries) * 256
+    record_bytes = sum(len(json.dumps(record)) for record in index['records'])
+    return coordinate_bytes + geometry_bytes + record_bytes
+
+
+def first_matches(index, geometries):
+    """
+    For each input geometry return the position of the first land use polygon
+    (in load order) that intersects it, or -1 when nothing does
+    """
+    result = np.full(len(geometries), -1, dtype=np.int64)
+    if len(geometries) == 0 or len(index['records']) == 0:
+        return result
+
+    input_idx, tree_idx = index['tree'].query(geometries, predicate="intersects")
+    if len(input_idx) == 0:
+        return result
+
+    # Sort by (input, tree) so the first pair per input is the lowest tree index,
+    # which matches the old "first polygon in the list wins" loop
+    order = np.lexsort((tree_idx, input_idx))
+    input_idx = input_idx[order]
+    tree_idx = tree_idx[order]
+    first = np.ones(len(input_idx), dtype=bool)
+    first[1:] = input_idx[1:] != input_idx[:-1]
+    result[input_idx[first]] = tree_idx[first]
+    return result
+
+
+def building_geometries(buildings):
+    """Convert building GeoJSON polygons to a shapely array (None where missing or invalid)"""
+    return polygons_to_geometries([building.get('polygon') for building in buildings])
+
+
+def assign_land_use(buildings, index, geometries=None):
+    """
+    Set building['land_use'] from the first intersecting land use polygon, returns the
+    match count. geometries are the buildings' shapely polygons if the caller has them
+    """
+    if geometries is None:
+        geometries = building_geometries(buildings)
+    matches = first_matches(index, geometries)
+
+    matched_count = 0
+    for building, match in zip(buildings, matches):
+        if match >= 0:
+            building['land_use'] = land_use_summary(index['records'][match])
+            matched_count += 1
+        else:
+            building['land_use'] = None
+    return matched_count
+
+
+def covers_points(index, longitudes, latitudes):
+    """Boolean mask of the points that fall inside the extent of the loaded land use polygons"""
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    extent = index.get('extent')
+    if extent is None:
+        return np.zeros(len(longitudes), dtype=bool)
+    min_lng, min_lat, max_lng, max_lat = extent
+    return ((longitudes >= min_lng) & (longitudes <= max_lng) &
+            (latitudes >= min_lat) & (latitudes <= max_lat))
+
+
+def covers_point(index, longitude, latitude):
+    """Check whether a point falls inside the extent of the loaded land use polygons"""
+    return bool(covers_points(index, [longitude], [latitude])[0])
+
+
+def find_land_use_many(index, longitudes, latitudes):
+    """Index of the first land use polygon containing each point (-1 for none), in one tree query"""
+    points = shapely.points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+    return first_matches(index, points)
+
+
+def find_land_use_at(index, longitude, latitude):
+    """Return the full land use record containing the point, or None"""
+    match = find_land_use_many(index, [longitude], [latitude])[0]
+    if match < 0:
+        return None
+    return index['records'][match]
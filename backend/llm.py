@@ -1,24 +1,91 @@
 import requests
+from requests.adapters import HTTPAdapter
+import logging
 import os
 import re
 import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from db import get_cached_filter, put_cached_filter
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# How long a cached LLM extraction stays valid, in seconds (default 30 days)
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 30 * 24 * 3600))
+# Maximum number of queries kept in the LLM cache
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 10000))
+
+# Seconds to wait for the Hugging Face API before giving up on a query
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', 15))
+# Seconds to wait for a connection to the Hugging Face API
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 5))
+# Maximum number of queries extracted at the same time
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+
+def new_llm_session():
+    """Keep-alive session for the Hugging Face API, pooled for the extraction threads"""
+    new = requests.Session()
+    new.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=LLM_MAX_CONCURRENCY))
+    return new
+
+def reset_llm_session():
+    """Start over with a fresh session (after a fork, so the parent's sockets aren't shared)"""
+    global llm_session
+    llm_session = new_llm_session()
+
+llm_session = new_llm_session()
+
+# Shared pool so extractions that miss a request's deadline can finish (and get
+# cached) in the background without holding up the request
+extraction_pool = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix='llm')
+
+# Hit/miss counters for the LLM cache (per process)
+llm_cache_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'lookup_seconds': 0.0,
+    'llm_calls': 0,
+    'llm_seconds': 0.0
+}
+
+def normalize_query(user_query):
+    """Normalize a query so trivially different spellings share a cache entry"""
+    query = user_query.lower().strip()
+    query = re.sub(r'\s+', ' ', query)
+    return query.rstrip('.!?')
 
 def extract_filter_with_llm(user_query):
     """Use Hugging Face LLM to extract filter criteria from natural language"""
-        
-    # Try pattern matching for natural language to save on api credits
-    # nlp_result = extract_filter_nlp_patterns(user_query)
-    # if nlp_result:
-    #     print(f"NLP pattern matching worked: {nlp_result}")
-    #     return nlp_result
-    
+
+    # Queries get repeated a lot, so check the persistent cache before the network
+    query_key = normalize_query(user_query)
+    start = time.perf_counter()
+    cached = get_cached_filter(query_key, LLM_CACHE_TTL)
+    llm_cache_stats['lookup_seconds'] += time.perf_counter() - start
+    if cached is not None:
+        llm_cache_stats['hits'] += 1
+        logger.debug("LLM cache hit for %r", query_key)
+        return cached
+    llm_cache_stats['misses'] += 1
+
+    parsed = call_llm(user_query)
+    # Only keep answers that look like filter criteria
+    if isinstance(parsed, dict) and {'attribute', 'operator', 'value'} <= parsed.keys():
+        if put_cached_filter(query_key, parsed, LLM_CACHE_MAX_ENTRIES):
+            llm_cache_stats['stores'] += 1
+    return parsed
+
+def call_llm(user_query):
+    """Ask the Hugging Face router to convert a query to filter criteria"""
 
     hf_token = os.getenv('HUGGINGFACE_API_TOKEN')
     if not hf_token:
-        print("Warning: No Hugging Face API token found, all parsing methods failed")
+        logger.warning("No Hugging Face API token found, all parsing methods failed")
         return None
 
-    print(f"Using LLM to parse: {user_query}")
+    logger.info("Using LLM to parse %r", user_query)
 
     api_url = "https://router.huggingface.co/hf-inference/models/HuggingFaceTB/SmolLM3-3B/v1/chat/completions"
 
@@ -36,6 +103,7 @@ Available attributes:
 - larger,bigger,above,taller, greater than: >
 - smaller,shorter,below,less than: <
 - is: ==
+- between X and Y: use the operator "between" with the value [X, Y]
 
 Respond only with JSON like: {{"attribute": "height", "operator": ">", "value": 100}}"""
 
@@ -55,11 +123,18 @@ Respond only with JSON like: {{"attribute": "height", "operator": ">", "value":
     }
 
     try:
-        response = requests.post(api_url, headers=headers, json=payload)
+        llm_cache_stats['llm_calls'] += 1
+        start = time.perf_counter()
+        try:
+            with timed('llm_call'):
+                response = llm_session.post(api_url, headers=headers, json=payload,
+                                            timeout=(LLM_CONNECT_TIMEOUT, LLM_REQUEST_TIMEOUT))
+        finally:
+            llm_cache_stats['llm_seconds'] += time.perf_counter() - start
         response.raise_for_status()
 
         result = response.json()
-        print("Raw output:", result)
+        logger.debug("Raw LLM output: %s", result)
 
         # Extract content
         content = result['choices'][0]['message']['content']
@@ -70,56 +145,178 @@ Respond only with JSON like: {{"attribute": "height", "operator": ">", "value":
             json_str = match.group(1)
             try:
                 parsed = json.loads(json_str)
-                print(parsed)
+                logger.debug("Parsed LLM output: %s", parsed)
                 # {'attribute': 'height', 'operator': '>', 'value': 50}
                 return parsed
             except json.JSONDecodeError as e:
-                print("Invalid JSON:", e)
+                logger.warning("Invalid JSON in LLM output: %s", e)
         else:
-            print("No JSON found in the content")
+            logger.warning("No JSON found in the LLM output")
     except Exception as e:
-        print(f"Error calling Hugging Face API: {e}")
+        logger.warning("Error calling Hugging Face API: %s", e)
 
     return None
 
 """ from chatgpt """
-def extract_filter_nlp_patterns(user_query):
-    """Extract filters using natural language pattern matching"""
+# Compiled once at import: (pattern, attribute, operator, confidence). More specific
+# patterns come first, so "ground elevation above X" isn't read as a height filter
+FILTER_PATTERNS = [
+    # "ground elevation between X and Y" - two capture groups make a "between" range
+    (re.compile(r'(?:ground|base).*?between\s*(\d+(?:\.\d+)?)\s*(?:meters?|m)?\s*and\s*(\d+(?:\.\d+)?)'), 'grd_elev_min_z', 'between', 0.9),
+    # "roof elevation between X and Y"
+    (re.compile(r'(?:roof|rooftop).*?between\s*(\d+(?:\.\d+)?)\s*(?:meters?|m)?\s*and\s*(\d+(?:\.\d+)?)'), 'rooftop_elev_z', 'between', 0.9),
+    # "buildings between X and Y meters"
+    (re.compile(r'between\s*(\d+(?:\.\d+)?)\s*(?:meters?|m)?\s*and\s*(\d+(?:\.\d+)?)'), 'height', 'between', 0.9),
+    # "ground level above X"
+    (re.compile(r'(?:ground|base).*?(?:above|over|higher than|greater than|>)\s*(\d+(?:\.\d+)?)'), 'grd_elev_min_z', '>', 0.9),
+    # "ground level below X"
+    (re.compile(r'(?:ground|base).*?(?:below|under|lower than|less than|<)\s*(\d+(?:\.\d+)?)'), 'grd_elev_min_z', '<', 0.9),
+    # "roof elevation above X"
+    (re.compile(r'(?:roof|rooftop).*?(?:above|over|higher than|greater than|>)\s*(\d+(?:\.\d+)?)'), 'rooftop_elev_z', '>', 0.9),
+    # "roof elevation below X"
+    (re.compile(r'(?:roof|rooftop).*?(?:below|under|lower than|less than|<)\s*(\d+(?:\.\d+)?)'), 'rooftop_elev_z', '<', 0.9),
+    # "buildings taller than X"
+    (re.compile(r'(?:buildings?|structures?).*?(?:taller|higher).*?(?:than|>)\s*(\d+(?:\.\d+)?)'), 'height', '>', 0.95),
+    # "buildings shorter than X"
+    (re.compile(r'(?:buildings?|structures?).*?(?:shorter|lower).*?(?:than|<)\s*(\d+(?:\.\d+)?)'), 'height', '<', 0.95),
+    # "tall buildings" or "height above X" or "above X meters" - use rooftop elevation as proxy for height
+    (re.compile(r'(?:tall|height).*?(?:above|over|greater than|>)\s*(\d+(?:\.\d+)?)'), 'height', '>', 0.85),
+    (re.compile(r'(?:above|over)\s*(\d+(?:\.\d+)?)\s*(?:meters?|m)'), 'height', '>', 0.85),
+    # "short buildings" or "height below X"
+    (re.compile(r'(?:short|low|height).*?(?:below|under|less than|<)\s*(\d+(?:\.\d+)?)'), 'height', '<', 0.85),
+    (re.compile(r'(?:below|under)\s*(\d+(?:\.\d+)?)\s*(?:meters?|m)'), 'height', '<', 0.85),
+    # Simple "X meters" (assume height), the direction is a guess
+    (re.compile(r'(\d+(?:\.\d+)?)\s*(?:meters?|m)'), 'height', '>', 0.4),
+]
+
+# Words that mean the query says more than a single comparison can capture
+COMPLEX_QUERY_PATTERN = re.compile(r'\b(?:and|or|between|feet|ft|storeys?|stories|floors?)\b')
+# Negations flip the meaning even when a pattern swallows them with .*?
+NEGATION_PATTERN = re.compile(r"\b(?:not|no|except|without|isn't|aren't)\b")
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+# Elevations in this data are above sea level (rooftop or ground), so a query about one
+# that no roof/ground pattern caught is not a height filter the patterns can be sure of
+ELEVATION_PATTERN = re.compile(r'\b(?:elevations?|altitudes?|sea level)\b')
+
+# Pattern matches at or above this confidence skip the LLM
+PATTERN_CONFIDENCE_THRESHOLD = float(os.getenv('PATTERN_CONFIDENCE_THRESHOLD', 0.8))
+
+# Per-tier counters for extract_filters (per process)
+extraction_stats = {
+    tier: {'count': 0, 'seconds': 0.0}
+    for tier in ('pattern', 'llm', 'pattern_fallback', 'unresolved')
+}
+
+def match_filter_pattern(user_query):
+    """
+    Match a query against the precompiled patterns.
+    Returns (criteria, confidence), or (None, 0.0) if nothing matched
+    """
     query = user_query.lower().strip()
-    
-    # Pattern matching for common phrases
-    patterns = [
-        # "tall buildings" or "height above X" or "above X meters" - use rooftop elevation as proxy for height
-        (r'(?:tall|height|elevation).*?(?:above|over|greater than|>)\s*(\d+(?:\.\d+)?)', 'height', '>'),
-        (r'(?:above|over)\s*(\d+(?:\.\d+)?)\s*(?:meters?|m)', 'height', '>'),
-        # "short buildings" or "height below X"  
-        (r'(?:short|low|height|elevation).*?(?:below|under|less than|<)\s*(\d+(?:\.\d+)?)', 'height', '<'),
-        (r'(?:below|under)\s*(\d+(?:\.\d+)?)\s*(?:meters?|m)', 'height', '<'),
-        # "ground level above X"
-        (r'(?:ground|base).*?(?:above|over|>)\s*(\d+(?:\.\d+)?)', 'grd_elev_min_z', '>'),
-        # "ground level below X"
-        (r'(?:ground|base).*?(?:below|under|<)\s*(\d+(?:\.\d+)?)', 'grd_elev_min_z', '<'),
-        # "buildings taller than X"
-        (r'(?:buildings?|structures?).*?(?:taller|higher).*?(?:than|>)\s*(\d+(?:\.\d+)?)', 'height', '>'),
-        # "buildings shorter than X"
-        (r'(?:buildings?|structures?).*?(?:shorter|lower).*?(?:than|<)\s*(\d+(?:\.\d+)?)', 'height', '<'),
-        # Simple "X meters" (assume height)
-        (r'(\d+(?:\.\d+)?)\s*(?:meters?|m)', 'height', '>'),
-    ]
-    
-    print(f"Trying to match patterns for: '{query}'")
-    
-    for i, (pattern, attribute, operator) in enumerate(patterns):
-        match = re.search(pattern, query)
+
+    for pattern, attribute, operator, confidence in FILTER_PATTERNS:
+        match = pattern.search(query)
         if match:
-            value = match.group(1)
+            # Anything the pattern didn't consume that looks like another condition
+            # means it only understood part of the query
+            remaining = query[:match.start()] + ' ' + query[match.end():]
+            if COMPLEX_QUERY_PATTERN.search(remaining):
+                confidence *= 0.5
+            if NUMBER_PATTERN.search(remaining):
+                confidence *= 0.5
+            if NEGATION_PATTERN.search(query):
+                confidence *= 0.5
+            if attribute == 'height' and ELEVATION_PATTERN.search(query):
+                confidence *= 0.5
+            value = list(match.groups()) if operator == 'between' else match.group(1)
             result = {
                 'attribute': attribute,
                 'operator': operator,
                 'value': value
             }
-            print(f"Pattern {i} matched: {result}")
-            return result
-    
-    print("No patterns matched")
+            return result, confidence
+
+    return None, 0.0
+
+def extract_filter_nlp_patterns(user_query):
+    """Extract filters using natural language pattern matching"""
+    result, confidence = match_filter_pattern(user_query)
+    if result:
+        logger.debug("Pattern matched %s (confidence %.2f)", result, confidence)
+    else:
+        logger.debug("No patterns matched")
+    return result
+
+def record_tier(tier, start):
+    stats = extraction_stats[tier]
+    stats['count'] += 1
+    stats['seconds'] += time.perf_counter() - start
+
+def extract_filter_with_fallback(user_query, pattern_result):
+    """The (cached) LLM's criteria for a query, else its low confidence pattern match"""
+    start = time.perf_counter()
+    llm_result = extract_filter_with_llm(user_query)
+    if llm_result:
+        record_tier('llm', start)
+        return llm_result
+
+    # The LLM couldn't help, a low confidence guess is better than nothing
+    if pattern_result:
+        record_tier('pattern_fallback', start)
+        logger.info("Using low confidence pattern match for %r: %s", user_query, pattern_result)
+        return pattern_result
+
+    record_tier('unresolved', start)
     return None
+
+def extract_filters(user_queries, deadline):
+    """
+    Extract criteria for several queries concurrently, each distinct query once.
+    Returns {query: criteria} and {query: reason} for queries that couldn't be
+    resolved, either because nothing understood them or they missed the deadline
+    (seconds from now)
+    """
+    # Queries that normalize the same way share one extraction. The cheapest method that
+    # is confident enough wins: confident pattern matches are answered right here, only
+    # the rest wait for a pool thread to ask the (cached) LLM
+    futures = {}
+    for query in user_queries:
+        query_key = normalize_query(query)
+        if query_key in futures:
+            continue
+        start = time.perf_counter()
+        pattern_result, confidence = match_filter_pattern(query)
+        if pattern_result and confidence >= PATTERN_CONFIDENCE_THRESHOLD:
+            record_tier('pattern', start)
+            logger.debug("Pattern matched %r: %s (confidence %.2f)", query, pattern_result, confidence)
+            futures[query_key] = Future()
+            futures[query_key].set_result(pattern_result)
+        else:
+            futures[query_key] = extraction_pool.submit(extract_filter_with_fallback, query, pattern_result)
+
+    with timed('llm_extraction'):
+        done, _ = wait(futures.values(), timeout=deadline)
+
+    # Extractions that never got a thread would otherwise sit in the queue ahead of
+    # later requests; ones already running finish and get cached in the background
+    for future in futures.values():
+        if future not in done:
+            future.cancel()
+
+    criteria = {}
+    unresolved = {}
+    for query in user_queries:
+        future = futures[normalize_query(query)]
+        if future not in done:
+            unresolved[query] = 'timeout'
+            continue
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning("Error extracting filter from query %r: %s", query, e)
+            result = None
+        if result:
+            criteria[query] = result
+        else:
+            unresolved[query] = 'not understood'
+    return criteria, unresolved
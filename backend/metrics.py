@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets in seconds, from cache hits up to slow upstream fetches
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# (stage, seconds) timings of the request being handled by this thread, None outside requests
+request_timings = ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """Thread-safe Prometheus-style histogram with cumulative buckets per label set (per process)"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> {'counts', 'sum', 'count'}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._series[label_values] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        # Copy under the lock so a scrape sees each series consistently
+        with self._lock:
+            snapshot = [(label_values, list(series['counts']), series['sum'], series['count'])
+                        for label_values, series in sorted(self._series.items())]
+        for label_values, counts, total, count in snapshot:
+            labels = dict(zip(self.label_names, label_values))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{format_labels(labels, le=bound)} {bucket_count}")
+            lines.append(f"{self.name}_bucket{format_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+def format_labels(labels, le=None):
+    """{key="value",...} label block with values escaped, empty without labels"""
+    if le is not None:
+        labels = {**labels, 'le': le}
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metric(name, metric_type, help_text, samples):
+    """Exposition lines for a counter or gauge from (labels, value) samples"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+    return lines
+
+
+stage_seconds = Histogram('calgary_stage_duration_seconds', 'Time spent in each processing stage', ('stage',))
+request_seconds = Histogram('calgary_request_duration_seconds', 'Time spent handling requests',
+                            ('endpoint', 'method', 'status'))
+
+
+def start_request():
+    """Start collecting stage timings for the request on this thread"""
+    request_timings.set([])
+
+
+def finish_request():
+    """Stage timings collected for the request on this thread, which stops collecting"""
+    timings = request_timings.get() or []
+    request_timings.set(None)
+    return timings
+
+
+@contextmanager
+def timed(stage):
+    """Time a block into the stage histogram and, inside a request, its Server-Timing header"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe((stage,), elapsed)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def server_timing_header(timings, total=None):
+    """Server-Timing header value, with repeated stages added up in the order they first ran"""
+    durations = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    if total is not None:
+        durations['total'] = total
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items())
@@ -0,0 +1,144 @@
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# X-Profile must carry this value, and downloads need it too
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+# Requests are only profiled when this is on and they carry the X-Profile header. Profiles
+# and their labels (request paths with their query strings) must not be open to anyone,
+# so profiling stays off without a token
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() in ('true', '1', 'yes')
+if PROFILING_ENABLED and not PROFILING_TOKEN:
+    logger.warning("PROFILING_ENABLED is set without a PROFILING_TOKEN; profiling stays disabled")
+    PROFILING_ENABLED = False
+# Minimum seconds between two profiled requests in one worker; only one runs at a time
+PROFILING_MIN_INTERVAL = float(os.getenv('PROFILING_MIN_INTERVAL', 60))
+# Where profiles are written for download, and how many are kept
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', 20))
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]+-[0-9]+$')
+
+# The profile being taken in this process, and when the last one started
+profiling_state = {
+    'active': False,
+    'last_started': 0.0,
+    'taken': 0,
+    'skipped': 0
+}
+profiling_lock = threading.Lock()
+
+
+def authorized(token):
+    """Whether a request presenting token may profile or download profiles"""
+    if not PROFILING_ENABLED:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), PROFILING_TOKEN.encode('utf-8'))
+
+
+def start_profile():
+    """
+    Start a cProfile profiler for the current thread, or return None when another
+    profile is running or the last one started less than PROFILING_MIN_INTERVAL ago
+    """
+    current_time = time.time()
+    with profiling_lock:
+        if (profiling_state['active'] or
+                current_time - profiling_state['last_started'] < PROFILING_MIN_INTERVAL):
+            profiling_state['skipped'] += 1
+            return None
+        profiling_state['active'] = True
+        profiling_state['last_started'] = current_time
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler, label):
+    """Stop a profiler, write its stats to PROFILING_DIR and return the profile id"""
+    profiler.disable()
+    try:
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        profile_id = f"{int(time.time() * 1000)}-{os.getpid()}"
+        profiler.dump_stats(profile_path(profile_id))
+        with open(profile_path(profile_id) + '.txt', 'w') as label_file:
+            label_file.write(label)
+        prune_profiles()
+        logger.info("Profiled %s as %s", label, profile_id)
+        return profile_id
+    finally:
+        with profiling_lock:
+            profiling_state['active'] = False
+            profiling_state['taken'] += 1
+
+
+def profile_path(profile_id):
+    """Path of a stored profile, raising ValueError for anything that isn't a profile id"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        raise ValueError(f"Invalid profile id: {profile_id!r}")
+    return os.path.join(PROFILING_DIR, f"{profile_id}.prof")
+
+
+def list_profiles():
+    """Stored profiles, newest first, as [{'id', 'label', 'bytes'}]"""
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILING_DIR):
+        profile_id = name[:-len('.prof')]
+        if not name.endswith('.prof') or not PROFILE_ID_PATTERN.match(profile_id):
+            continue
+        path = os.path.join(PROFILING_DIR, name)
+        try:
+            with open(path + '.txt') as label_file:
+                label = label_file.read()
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        profiles.append({'id': profile_id, 'label': label, 'bytes': size})
+    # Ids start with the millisecond timestamp
+    profiles.sort(key=lambda profile: int(profile['id'].split('-')[0]), reverse=True)
+    return profiles
+
+
+def prune_profiles():
+    """Delete all but the PROFILING_KEEP newest profiles"""
+    for profile in list_profiles()[PROFILING_KEEP:]:
+        path = profile_path(profile['id'])
+        for stale in (path, path + '.txt'):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def profile_report(profile_id, sort='cumulative', limit=50):
+    """pstats text report of a stored profile. Raises ValueError for an unknown sort key"""
+    if sort not in ('cumulative', 'tottime', 'calls', 'ncalls'):
+        raise ValueError(f"Unsupported sort: {sort!r}")
+    output = io.StringIO()
+    stats = pstats.Stats(profile_path(profile_id), stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def profiling_status():
+    with profiling_lock:
+        taken = profiling_state['taken']
+        skipped = profiling_state['skipped']
+    return {
+        'enabled': PROFILING_ENABLED,
+        'min_interval_seconds': PROFILING_MIN_INTERVAL,
+        'taken': taken,
+        'skipped': skipped,
+        'stored': len(list_profiles())
+    }
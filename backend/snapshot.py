@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import shapely
+
+from geometry import polygons_to_geometries, geometries_to_polygons
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the snapshot layout or the processed building record changes
+SNAPSHOT_SCHEMA_VERSION = 1
+
+# Fields process_buildings passes through as strings (or None), in record order
+STRING_FIELDS = (
+    "grd_elev_min_x", "grd_elev_max_x", "grd_elev_min_y", "grd_elev_max_y",
+    "grd_elev_min_z", "grd_elev_max_z", "rooftop_elev_x", "rooftop_elev_y",
+    "rooftop_elev_z", "height", "struct_id"
+)
+
+
+def save_snapshot(path, buildings, geometries, metadata):
+    """
+    Write processed (land use joined) buildings to a compressed .npz: string columns with
+    a missing mask, numeric columns, WKB geometries in one byte buffer and the distinct
+    land use summaries. metadata is stored alongside the schema version. The file is
+    replaced atomically
+    """
+    if geometries is None:
+        geometries = polygons_to_geometries([building.get("polygon") for building in buildings])
+
+    arrays = {}
+    for field in STRING_FIELDS:
+        values = [building.get(field) for building in buildings]
+        arrays[field] = np.array(["" if value is None else str(value) for value in values], dtype=str)
+        arrays[f"{field}_missing"] = np.array([value is None for value in values], dtype=bool)
+
+    arrays["id"] = np.array([building["id"] for building in buildings], dtype=np.int64)
+    arrays["colour"] = np.array([building["colour"] for building in buildings], dtype=np.int64)
+    arrays["longitude"] = np.array([building["longitude"] for building in buildings], dtype=np.float64)
+    arrays["latitude"] = np.array([building["latitude"] for building in buildings], dtype=np.float64)
+
+    wkb = shapely.to_wkb(geometries)
+    arrays["wkb_lengths"] = np.array([len(blob) if blob is not None else -1 for blob in wkb], dtype=np.int64)
+    arrays["wkb"] = np.frombuffer(b"".join(blob for blob in wkb if blob is not None), dtype=np.uint8)
+
+    # Land use summaries repeat across buildings, so store each once and index into them
+    land_use = []
+    land_use_positions = {}
+    land_use_index = np.full(len(buildings), -1, dtype=np.int64)
+    for i, building in enumerate(buildings):
+        summary = building.get("land_use")
+        if summary is not None:
+            key = json.dumps(summary, sort_keys=True)
+            if key not in land_use_positions:
+                land_use_positions[key] = len(land_use)
+                land_use.append(summary)
+            land_use_index[i] = land_use_positions[key]
+    arrays["land_use_index"] = land_use_index
+
+    # Polygons shapely couldn't parse are kept as they came
+    unparsed = {str(i): building.get("polygon") for i, building in enumerate(buildings)
+                if geometries[i] is None and building.get("polygon")}
+
+    arrays["metadata"] = np.array(json.dumps({
+        **metadata,
+        "schema_version": SNAPSHOT_SCHEMA_VERSION,
+        "saved_at": time.time(),
+        "count": len(buildings),
+        "land_use": land_use,
+        "unparsed_polygons": unparsed
+    }))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temporary_path, path)
+
+
+def read_snapshot_metadata(path):
+    """Metadata of a snapshot, or None if it is missing, unreadable or from another schema version"""
+    try:
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+    except Exception as e:
+        # Truncated or corrupted files fail inside zipfile/numpy with all sorts of errors
+        logger.warning("Unreadable snapshot %s: %s", path, e)
+        return None
+    if metadata.get("schema_version") != SNAPSHOT_SCHEMA_VERSION:
+        return None
+    return metadata
+
+
+def load_snapshot(path):
+    """Rebuild (buildings, geometries, metadata) from a snapshot written by save_snapshot"""
+    with np.load(path) as data:
+        metadata = json.loads(str(data["metadata"]))
+        columns = {field: data[field].tolist() for field in STRING_FIELDS}
+        missing = {field: data[f"{field}_missing"] for field in STRING_FIELDS}
+        ids = data["id"].tolist()
+        colours = data["colour"].tolist()
+        longitudes = data["longitude"].tolist()
+        latitudes = data["latitude"].tolist()
+        wkb_lengths = data["wkb_lengths"]
+        wkb = data["wkb"].tobytes()
+        land_use_index = data["land_use_index"].tolist()
+
+    for field in STRING_FIELDS:
+        values = columns[field]
+        for i in np.flatnonzero(missing[field]).tolist():
+            values[i] = None
+
+    # Slice the WKB buffer back into one blob per building and parse them in bulk
+    present = wkb_lengths >= 0
+    ends = np.cumsum(np.where(present, wkb_lengths, 0))
+    blobs = np.empty(len(wkb_lengths), dtype=object)
+    for i in np.flatnonzero(present).tolist():
+        blobs[i] = wkb[ends[i] - wkb_lengths[i]:ends[i]]
+    geometries = shapely.from_wkb(blobs)
+    polygons = geometries_to_polygons(geometries)
+    for i, polygon in metadata["unparsed_polygons"].items():
+        polygons[int(i)] = polygon
+
+    land_use = metadata["land_use"]
+    buildings = []
+    for i in range(len(ids)):
+        building = {field: columns[field][i] for field in STRING_FIELDS if field != "struct_id"}
+        building.update({
+            "land_use": land_use[land_use_index[i]] if land_use_index[i] >= 0 else None,
+            "polygon": polygons[i],
+            "struct_id": columns["struct_id"][i],
+            "id": ids[i],
+            "colour": colours[i],
+            "longitude": longitudes[i],
+            "latitude": latitudes[i],
+        })
+        buildings.append(building)
+    return buildings, geometries, metadata
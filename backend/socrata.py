@@ -0,0 +1,110 @@
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Rows requested per page (SODA 2.1 allows up to 50000)
+SOCRATA_PAGE_SIZE = int(os.getenv('SOCRATA_PAGE_SIZE', 5000))
+# Maximum number of requests in flight to the Socrata API from this process
+SOCRATA_MAX_CONCURRENCY = int(os.getenv('SOCRATA_MAX_CONCURRENCY', 4))
+# Seconds to wait for a page before giving up
+SOCRATA_TIMEOUT = float(os.getenv('SOCRATA_TIMEOUT', 30))
+# Seconds to wait for a connection to the API
+SOCRATA_CONNECT_TIMEOUT = float(os.getenv('SOCRATA_CONNECT_TIMEOUT', 5))
+
+def new_session():
+    """Keep-alive session with enough pooled connections for the concurrency cap"""
+    new = requests.Session()
+    new.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=SOCRATA_MAX_CONCURRENCY))
+    new.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=SOCRATA_MAX_CONCURRENCY))
+    if os.getenv('CALGARY_APP_TOKEN'):
+        # Requests with an app token get a much higher throttling limit
+        new.headers['X-App-Token'] = os.getenv('CALGARY_APP_TOKEN')
+    return new
+
+
+def reset_session():
+    """
+    Start over with a fresh session. A forked process must call this before making
+    requests, or it would share the parent's pooled sockets with the parent
+    """
+    global session
+    session = new_session()
+
+
+# One keep-alive session shared by every worker thread
+session = new_session()
+
+# Caps concurrent upstream requests across all callers, including nested fetches
+_upstream_slots = threading.BoundedSemaphore(SOCRATA_MAX_CONCURRENCY)
+
+
+def get_json(url, params):
+    """GET a Socrata resource and return the decoded JSON"""
+    # Waiting for a slot is bounded too, so a stalled upstream can't pile up threads forever
+    if not _upstream_slots.acquire(timeout=SOCRATA_TIMEOUT):
+        raise requests.Timeout(f"No upstream slot free within {SOCRATA_TIMEOUT}s")
+    try:
+        response = session.get(url, params=params, timeout=(SOCRATA_CONNECT_TIMEOUT, SOCRATA_TIMEOUT))
+    finally:
+        _upstream_slots.release()
+    response.raise_for_status()
+    return response.json()
+
+
+def count_rows(url, where=None):
+    """Number of rows matching an optional $where clause"""
+    params = {"$select": "count(*) AS count"}
+    if where:
+        params["$where"] = where
+    data = get_json(url, params)
+    return int(data[0]["count"]) if data else 0
+
+
+def iter_pages(url, params=None, max_rows=1000, page_size=None, max_workers=None):
+    """
+    Fetch up to max_rows rows in $offset pages over a bounded worker pool.
+    Yields (page_number, rows) as each page arrives, which is not necessarily in order.
+    The first page is requested straight away; the rows are only counted, and the
+    remaining pages fetched, when it comes back full
+    """
+    params = dict(params or {})
+    page_size = page_size or SOCRATA_PAGE_SIZE
+    max_workers = max_workers or SOCRATA_MAX_CONCURRENCY
+    # Offset paging is only consistent with a stable sort order
+    params.setdefault("$order", ":id")
+
+    first_page = get_json(url, {**params, "$limit": min(page_size, max_rows), "$offset": 0})
+    yield 0, first_page
+    if max_rows <= page_size or len(first_page) < page_size:
+        return
+
+    total = min(max_rows, count_rows(url, params.get("$where")))
+    page_count = math.ceil(total / page_size)
+    if page_count <= 1:
+        return
+
+    def fetch_page(page_number):
+        offset = page_number * page_size
+        limit = min(page_size, total - offset)
+        return get_json(url, {**params, "$limit": limit, "$offset": offset})
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, page_count - 1)) as executor:
+        futures = {executor.submit(fetch_page, page): page for page in range(1, page_count)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def fetch_rows(url, params=None, max_rows=1000, page_size=None, max_workers=None):
+    """Fetch up to max_rows rows with concurrent paging, returned in $order order"""
+    pages = {}
+    for page_number, rows in iter_pages(url, params, max_rows, page_size, max_workers):
+        pages[page_number] = rows
+
+    result = []
+    for page_number in sorted(pages):
+        result.extend(pages[page_number])
+    return result
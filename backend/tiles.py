@@ -0,0 +1,99 @@
+import math
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+
+# Half the width of the web mercator world, in meters
+MERCATOR_HALF_WORLD = 20037508.342789244
+
+# Size of the tile grid in MVT units and how far geometries may spill over the edge
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+MAX_ZOOM = 22
+
+
+def valid_tile(z, x, y):
+    """Check that z/x/y addresses a tile that exists"""
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_bbox(z, x, y):
+    """Longitude/latitude bounds of an XYZ tile, as a bbox dict"""
+    n = 2 ** z
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return {
+        "min_lng": x / n * 360 - 180,
+        "max_lng": (x + 1) / n * 360 - 180,
+        "min_lat": latitude(y + 1),
+        "max_lat": latitude(y)
+    }
+
+
+def tile_mercator_bounds(z, x, y):
+    """Web mercator bounds (minx, miny, maxx, maxy) of an XYZ tile"""
+    size = 2 * MERCATOR_HALF_WORLD / 2 ** z
+    min_x = -MERCATOR_HALF_WORLD + x * size
+    max_y = MERCATOR_HALF_WORLD - y * size
+    return (min_x, max_y - size, min_x + size, max_y)
+
+
+def to_mercator(geometries):
+    """Project a shapely array from longitude/latitude to web mercator meters"""
+    def project(coords):
+        x = coords[:, 0] * MERCATOR_HALF_WORLD / 180
+        latitudes = np.clip(coords[:, 1], -85.05112878, 85.05112878)
+        y = np.log(np.tan((90 + latitudes) * np.pi / 360)) * MERCATOR_HALF_WORLD / np.pi
+        return np.column_stack((x, y))
+
+    return shapely.transform(geometries, project)
+
+
+def clip_to_tile(geometries, z, x, y):
+    """
+    Project geometries to mercator and clip them to the tile plus its buffer.
+    Returns (positions, clipped) for the inputs that have something left in the tile
+    """
+    min_x, min_y, max_x, max_y = tile_mercator_bounds(z, x, y)
+    buffer = (max_x - min_x) * TILE_BUFFER / TILE_EXTENT
+    clip_box = (min_x - buffer, min_y - buffer, max_x + buffer, max_y + buffer)
+
+    projected = to_mercator(geometries)
+    # Cheap bounds test first so only geometries near the tile get clipped
+    bounds = shapely.bounds(projected)
+    near = ((bounds[:, 0] <= clip_box[2]) & (bounds[:, 2] >= clip_box[0]) &
+            (bounds[:, 1] <= clip_box[3]) & (bounds[:, 3] >= clip_box[1]))
+    positions = np.flatnonzero(near)
+
+    clipped = shapely.clip_by_rect(projected[positions], *clip_box)
+    keep = ~shapely.is_empty(clipped)
+    return positions[keep], clipped[keep]
+
+
+def encode_tile(z, x, y, layers):
+    """
+    Encode layers into an MVT tile. layers is a list of
+    (name, geometries, properties) with geometries in longitude/latitude
+    """
+    encoded_layers = []
+    for name, geometries, properties in layers:
+        if len(geometries) == 0:
+            continue
+        positions, clipped = clip_to_tile(geometries, z, x, y)
+        features = [
+            {"geometry": geometry, "properties": properties[position], "id": int(position)}
+            for position, geometry in zip(positions.tolist(), clipped)
+        ]
+        if features:
+            encoded_layers.append({"name": name, "features": features})
+
+    # Quantizing to the tile bounds snaps coordinates onto the TILE_EXTENT grid
+    return mapbox_vector_tile.encode(encoded_layers, default_options={
+        "quantize_bounds": tile_mercator_bounds(z, x, y),
+        "extents": TILE_EXTENT,
+        "on_invalid_geometry": mapbox_vector_tile.encoder.on_invalid_geometry_make_valid
+    })
@@ -0,0 +1,109 @@
+import math
+
+# Default area shown by the map
+DOWNTOWN_BBOX = {
+    "max_lat": 51.06,
+    "min_lat": 51.04,
+    "min_lng": -114.09,
+    "max_lng": -114.05
+}
+
+
+def parse_bbox(value):
+    """
+    Parse a bbox given as "min_lng,min_lat,max_lng,max_lat", a 4 item list or a dict.
+    Returns None when no bbox was given, raises ValueError when it is malformed
+    """
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, dict):
+        bbox = {key: float(value[key]) for key in ("min_lng", "min_lat", "max_lng", "max_lat")}
+    else:
+        if isinstance(value, str):
+            value = value.split(",")
+        if len(value) != 4:
+            raise ValueError("bbox must have 4 values: min_lng,min_lat,max_lng,max_lat")
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in value)
+        bbox = {"min_lng": min_lng, "min_lat": min_lat, "max_lng": max_lng, "max_lat": max_lat}
+
+    if not all(math.isfinite(v) for v in bbox.values()):
+        raise ValueError("bbox values must be finite numbers")
+    if bbox["min_lng"] >= bbox["max_lng"] or bbox["min_lat"] >= bbox["max_lat"]:
+        raise ValueError("bbox min values must be smaller than max values")
+    if not (-180 <= bbox["min_lng"] and bbox["max_lng"] <= 180 and -90 <= bbox["min_lat"] and bbox["max_lat"] <= 90):
+        raise ValueError("bbox is outside of valid longitude/latitude range")
+    return bbox
+
+
+def parse_point(value):
+    """
+    Parse a point given as a [lng, lat] pair or a {"lng": ..., "lat": ...} dict into
+    (lng, lat), raising ValueError when it is malformed
+    """
+    if isinstance(value, dict):
+        if "lng" not in value or "lat" not in value:
+            raise ValueError("point must have lng and lat")
+        coordinates = (value["lng"], value["lat"])
+    elif isinstance(value, (list, tuple)):
+        if len(value) != 2:
+            raise ValueError("point must have 2 values: lng,lat")
+        coordinates = value
+    else:
+        raise ValueError("point must be a [lng, lat] pair or a {lng, lat} object")
+
+    # Numbers only; bools are ints in Python and numeric strings would be read as numbers
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in coordinates):
+        raise ValueError("point values must be numbers")
+    lng, lat = (float(v) for v in coordinates)
+    if not (math.isfinite(lng) and math.isfinite(lat)):
+        raise ValueError("point values must be finite numbers")
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+        raise ValueError("point is outside of valid longitude/latitude range")
+    return lng, lat
+
+
+def grid_tiles(bbox, tile_size):
+    """
+    Split a bbox into the fixed grid tiles (tile_size degrees square) that cover it.
+    Tiles are returned in a stable order (south to north, west to east) so
+    stitched results come out the same way every time
+    """
+    # Small epsilon so a bbox ending exactly on a grid line doesn't pull in the next tile
+    epsilon = 1e-9
+    min_x = math.floor(bbox["min_lng"] / tile_size + epsilon)
+    max_x = math.floor(bbox["max_lng"] / tile_size - epsilon)
+    min_y = math.floor(bbox["min_lat"] / tile_size + epsilon)
+    max_y = math.floor(bbox["max_lat"] / tile_size - epsilon)
+
+    tiles = []
+    for y in range(min_y, max_y + 1):
+        for x in range(min_x, max_x + 1):
+            tiles.append({
+                "min_lng": round(x * tile_size, 9),
+                "min_lat": round(y * tile_size, 9),
+                "max_lng": round((x + 1) * tile_size, 9),
+                "max_lat": round((y + 1) * tile_size, 9)
+            })
+    return tiles
+
+
+def count_grid_tiles(bbox, tile_size):
+    """Number of grid tiles needed to cover a bbox, without building them"""
+    epsilon = 1e-9
+    columns = math.floor(bbox["max_lng"] / tile_size - epsilon) - math.floor(bbox["min_lng"] / tile_size + epsilon) + 1
+    rows = math.floor(bbox["max_lat"] / tile_size - epsilon) - math.floor(bbox["min_lat"] / tile_size + epsilon) + 1
+    return columns * rows
+
+
+def polygon_intersects_bbox(polygon, bbox):
+    """Check whether a GeoJSON polygon's bounds overlap a bbox"""
+    if not polygon or not polygon.get("coordinates"):
+        return False
+    coords = polygon["coordinates"][0]
+    if not coords:
+        return False
+    lngs = [coord[0] for coord in coords]
+    lats = [coord[1] for coord in coords]
+    return (min(lngs) <= bbox["max_lng"] and max(lngs) >= bbox["min_lng"] and
+            min(lats) <= bbox["max_lat"] and max(lats) >= bbox["min_lat"])
@@ -2,8 +2,14 @@ import axios from 'axios';
 
 const API_URL = process.env.REACT_APP_API_URL; // set correct backend URL in .env file
 
-export const fetchBuildings = async () => {
-  const res = await axios.get(`${API_URL}/buildings-with-land-use`);
+// bbox (optional): [minLng, minLat, maxLng, maxLat] of the viewport, defaults to downtown on the backend
+// zoom (optional): map zoom, lower zooms get simplified polygons with fewer decimals
+export const fetchBuildings = async (bbox = null, zoom = null) => {
+  const params = bbox ? { bbox: bbox.join(',') } : {};
+  if (zoom !== null) {
+    params.zoom = Math.floor(zoom);
+  }
+  const res = await axios.get(`${API_URL}/buildings-with-land-use`, { params });
 //   const dummyBuildings = [
 //     {
 //         polygon: {
@@ -41,10 +47,30 @@ export const fetchLandUse = async (longitude, latitude) => {
 
 }
 
-export const filterBuildings = async (query) => {
+// points: array of [longitude, latitude] pairs, returns land use records (or null) in the same order
+export const fetchLandUseBatch = async (points) => {
+  try {
+    const response = await axios.post(`${API_URL}/land-use/batch`, {
+      points: points
+    });
+
+    if (response.data.status === 'success') {
+      return response.data.data;
+    } else {
+      console.error('API Error:', response.data.message);
+      return points.map(() => null);
+    }
+  } catch (error) {
+    console.error('Error fetching land use batch:', error);
+    return points.map(() => null);
+  }
+};
+
+export const filterBuildings = async (query, bbox = null) => {
   try {
     const response = await axios.post(`${API_URL}/filter-buildings`, {
-      query: query
+      query: query,
+      ...(bbox && { bbox: bbox })
     });
     return response.data;
   } catch (error) {
@@ -53,10 +79,11 @@ export const filterBuildings = async (query) => {
   }
 };
 
-export const filterBuildingsMultiple = async (queries) => {
+export const filterBuildingsMultiple = async (queries, bbox = null) => {
   try {
     const response = await axios.post(`${API_URL}/filter-buildings`, {
-      queries: queries
+      queries: queries,
+      ...(bbox && { bbox: bbox })
     });
     return response.data;
   } catch (error) {
@@ -120,4 +147,32 @@ export const listUserFilters = async (username) => {
     console.error('Error listing filters:', error);
     return { success: false, error: error.message };
   }
-};
\ No newline at end of file
+};
+// filterSets: object mapping filter name -> filters
+export const saveFiltersBulk = async (username, filterSets) => {
+  try {
+    const response = await axios.post(`${API_URL}/filters/save-bulk`, {
+      username: username,
+      filter_sets: filterSets
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error saving filters:', error);
+    return { success: false, error: error.message };
+  }
+};
+
+export const deleteFiltersBulk = async (username, filterNames) => {
+  try {
+    const response = await axios.delete(`${API_URL}/filters/delete-bulk`, {
+      data: {
+        username: username,
+        filter_names: filterNames
+      }
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error deleting filters:', error);
+    return { success: false, error: error.message };
+  }
+};